@@ -13,6 +13,7 @@ from lms.djangoapps.instructor.views.api import require_level, common_exceptions
 from .tasks import get_psychometrics_data as get_psychometrics_data_task
 from .tasks import get_views_data as get_views_data_task
 from .tasks import get_enrollments_data as get_enrollments_data_task
+from .utils import pyarrow
 
 from lms.djangoapps.instructor_task.api_helper import submit_task
 
@@ -30,7 +31,11 @@ def submit_get_psychometrics_data(request, course_key):
     """
     task_type = 'get_psychometrics_data'
     task_class = get_psychometrics_data_task
-    task_input = {}
+    task_input = {
+        'incremental': request.POST.get('incremental') == 'true',
+        'lightweight_problem_metadata': request.POST.get('lightweight_problem_metadata') == 'true',
+        'output_format': 'parquet' if request.POST.get('output_format') == 'parquet' else 'csv',
+    }
     task_key = ''
 
     return submit_task(request, task_type, task_class, course_key, task_input, task_key)
@@ -47,6 +52,9 @@ def get_psychometrics_data(request, course_id):
     Pushes a Celery task which will aggregate psychometrics data.
     """
     course_key = CourseKey.from_string(course_id)
+    if request.POST.get('output_format') == 'parquet' and pyarrow is None:
+        return JsonResponse({"error": _("The parquet output format is not available: pyarrow is not installed.")},
+                            status=400)
     report_type = _('get_psychometrics_data')
     submit_get_psychometrics_data(request, course_key)
     success_status = SUCCESS_MESSAGE_TEMPLATE.format(report_type=report_type)
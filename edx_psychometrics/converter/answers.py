@@ -1,6 +1,8 @@
 import csv
 import logging
 
+import utils
+
 __all__ = ['AnswersParser']
 
 
@@ -9,6 +11,13 @@ class AnswersParser:
         self.answers = []
         self._parse(answers)
 
+    def for_course(self, course_name):
+        answers = AnswersParser([])
+        answers.answers = [
+            answer for answer in self.answers
+            if utils.in_course(answer[0], course_name)]
+        return answers
+
     def _parse(self, answers):
         reader = csv.reader(answers, delimiter=';')
         for (i, item) in enumerate(reader):
@@ -0,0 +1,216 @@
+"""
+Reproducible synthetic EdX tracking log.
+
+Run from the converter directory:
+
+    $ python -m benchmarks.generate --learners 1000 ../data/logs
+"""
+import argparse
+import datetime
+import json
+import random
+
+
+COURSE_ID = 'course-v1:bench+BN101+2018'
+HOST = 'https://lms.local'
+START = datetime.datetime(2018, 3, 1)
+
+NOISE_EVENTS = (
+    ('/courses/{course}/courseware/{chapter}/{sequential}/', 'server'),
+    ('/courses/{course}/xblock/handler/', 'server'),
+    ('page_close', 'browser'),
+    ('seq_goto', 'browser'),
+    ('seq_next', 'browser'),
+    ('edx.ui.lms.sequence.tab_selected', 'browser'),
+    ('problem_show', 'browser'),
+    ('problem_check', 'browser'),
+    ('pause_video', 'browser'),
+    ('stop_video', 'browser'),
+)
+
+
+class LogGenerator:
+    """
+    Writes the tracking log of a course with `problems` problems, `videos`
+    videos and `ora` open assessments spread over `modules` chapters.
+
+    Every learner watches some videos, solves some problems in one or more
+    attempts and submits some assessments, which other learners review.
+    About `noise` of all the lines are events the converter skips.
+    """
+
+    def __init__(self, *, learners=100, problems=20, videos=20, ora=2,
+                 modules=5, noise=0.9, seed=0):
+        self.learners = learners
+        self.problems = problems
+        self.videos = videos
+        self.ora = ora
+        self.modules = modules
+        self.noise = noise
+        self.rand = random.Random(seed)
+        self.time = START
+        self.lines = 0
+
+    def get_params(self):
+        return {
+            'learners': self.learners, 'problems': self.problems,
+            'videos': self.videos, 'ora': self.ora,
+            'modules': self.modules, 'noise': self.noise,
+        }
+
+    def _chapter(self, index):
+        return 'chapter{}'.format(index % self.modules)
+
+    def _page(self, index):
+        return '{}/courses/{}/courseware/{}/sequential{}/1?activate'.format(
+            HOST, COURSE_ID, self._chapter(index), index)
+
+    def _block(self, block_type, index):
+        return 'block-v1:{}+type@{}+block@{}{:04d}'.format(
+            COURSE_ID.split(':', 1)[1], block_type, block_type, index)
+
+    def _event(self, event_type, user_id, **fields):
+        self.time += datetime.timedelta(
+            milliseconds=self.rand.randint(1, 5000))
+        item = {
+            'event_type': event_type,
+            'event_source': fields.pop('event_source', 'browser'),
+            'time': self.time.isoformat() + '+00:00',
+            'context': {'course_id': COURSE_ID, 'user_id': user_id},
+            'host': 'lms.local',
+            'accept_language': 'ru-RU,ru;q=0.9',
+            'agent': 'Mozilla/5.0 (X11; Linux x86_64)',
+        }
+        item.update(fields)
+        return item
+
+    def _noise(self, user_id):
+        (event_type, source) = self.rand.choice(NOISE_EVENTS)
+        index = self.rand.randrange(max(self.problems, 1))
+        event_type = event_type.format(
+            course=COURSE_ID, chapter=self._chapter(index),
+            sequential='sequential{}'.format(index))
+        return self._event(
+            event_type, user_id, event_source=source,
+            event=json.dumps({'id': 'noise', 'old': 1, 'new': 2}),
+            page=self._page(index))
+
+    def _video(self, user_id, index):
+        video_id = 'video{:04d}'.format(index)
+        event = json.dumps({'id': video_id, 'code': 'html5'})
+        yield self._event('load_video', user_id, event=event,
+                          page=self._page(index))
+        yield self._event('play_video', user_id, event=event,
+                          page=self._page(index))
+
+    def _problem(self, user_id, index):
+        problem_id = self._block('problem', index)
+        subtasks = ['{}_{}_1'.format(problem_id.split('@')[-1], i)
+                    for i in range(2, 2 + self.rand.randint(1, 3))]
+        for attempt in range(self.rand.choice((1, 1, 1, 2, 3))):
+            correct = self.rand.random() < 0.4 + 0.3 * attempt
+            submitted = self._event(
+                'edx.grades.problem.submitted', user_id,
+                event_source='server', referer=self._page(index),
+                event={'problem_id': problem_id, 'weighted_earned': 1})
+            yield submitted
+            check = self._event(
+                'problem_check', user_id, event_source='server',
+                event={'problem_id': problem_id, 'submission': {
+                    subtask: {
+                        'question': 'Question {}'.format(subtask),
+                        'response_type': 'choiceresponse',
+                        'correct': correct,
+                    } for subtask in subtasks}})
+            check['time'] = submitted['time']
+            yield check
+
+    def _submission(self, user_id, index, reviewers):
+        block = self._block('openassessment', index)
+        submission_id = '{:08x}-{}'.format(self.rand.getrandbits(32), user_id)
+        module = {'usage_key': block, 'display_name': 'Essay {}'.format(index)}
+        yield self._event(
+            'openassessmentblock.create_submission', user_id,
+            event_source='server', referer=self._page(index),
+            context={'course_id': COURSE_ID, 'user_id': user_id,
+                     'module': module},
+            event={'submission_uuid': submission_id})
+        for reviewer in reviewers:
+            yield self._event(
+                'openassessmentblock.peer_assess', reviewer,
+                event_source='server',
+                event={'submission_uuid': submission_id, 'parts': [
+                    {'option': {'points': self.rand.randint(0, 3)},
+                     'criterion': {'points_possible': 3}}
+                    for _ in range(3)]})
+
+    def _learner_events(self, user_id):
+        activities = []
+        for index in range(self.videos):
+            if self.rand.random() < 0.7:
+                activities.append((self._video, index))
+        for index in range(self.problems):
+            if self.rand.random() < 0.6:
+                activities.append((self._problem, index))
+        self.rand.shuffle(activities)
+        for (activity, index) in activities:
+            yield from activity(user_id, index)
+
+        for index in range(self.ora):
+            if self.rand.random() < 0.5:
+                reviewers = [str(self.rand.randrange(self.learners))
+                             for _ in range(2)]
+                yield from self._submission(user_id, index, reviewers)
+
+    def lines_iter(self):
+        noise_per_event = self.noise / (1 - self.noise) if self.noise < 1 else 0
+        for learner in range(self.learners):
+            user_id = str(learner)
+            for item in self._learner_events(user_id):
+                for _ in range(self._poisson(noise_per_event)):
+                    yield self._format(self._noise(user_id))
+                yield self._format(item)
+
+    def _poisson(self, mean):
+        # number of noise lines around an event, with the given mean
+        (count, total) = (0, self.rand.expovariate(1))
+        while total < mean:
+            count += 1
+            total += self.rand.expovariate(1)
+        return count
+
+    def _format(self, item):
+        self.lines += 1
+        # the converter takes the JSON after the first colon of the line
+        return 'lms.local [tracking] {}: {}\n'.format(
+            self.lines, json.dumps(item))
+
+    def write(self, file):
+        for line in self.lines_iter():
+            file.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--learners', type=int, default=100)
+    parser.add_argument('--problems', type=int, default=20)
+    parser.add_argument('--videos', type=int, default=20)
+    parser.add_argument('--ora', type=int, default=2)
+    parser.add_argument('--modules', type=int, default=5)
+    parser.add_argument('--noise', type=float, default=0.9,
+                        help='Share of the lines the converter skips')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('output', type=str, help='Log file')
+    params = parser.parse_args()
+
+    generator = LogGenerator(
+        learners=params.learners, problems=params.problems,
+        videos=params.videos, ora=params.ora, modules=params.modules,
+        noise=params.noise, seed=params.seed)
+    with open(params.output, 'w', encoding='utf8') as file:
+        generator.write(file)
+    print('{} lines'.format(generator.lines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of the LogParser event dispatch.
+
+Run from the converter directory:
+
+    $ python -m benchmarks.registry
+"""
+import argparse
+import collections
+import json
+import random
+import timeit
+
+from logs import LogParser
+from utils import Registry
+
+
+# Share of event types in the tracking log of a typical course run
+EVENT_MIX = (
+    ('/courses/{course}/courseware/', 'server', 30),
+    ('/courses/{course}/xblock/handler/', 'server', 12),
+    ('page_close', 'browser', 10),
+    ('seq_goto', 'browser', 6),
+    ('seq_next', 'browser', 6),
+    ('edx.ui.lms.sequence.tab_selected', 'browser', 4),
+    ('problem_show', 'browser', 2),
+    ('problem_check', 'browser', 3),
+    ('problem_check', 'server', 3),
+    ('edx.grades.problem.submitted', 'server', 3),
+    ('load_video', 'browser', 5),
+    ('play_video', 'browser', 5),
+    ('pause_video', 'browser', 5),
+    ('stop_video', 'browser', 2),
+    ('openassessmentblock.create_submission', 'server', 1),
+    ('openassessmentblock.peer_assess', 'server', 1),
+    ('edx.course.enrollment.activated', 'server', 2),
+)
+
+
+class LinearRegistry(Registry):
+    """The dispatch checking every handler in turn."""
+
+    def __call__(self, obj, item):
+        for (kwargs, func) in self.handlers:
+            if Registry.check_item(item, kwargs):
+                return func(obj, item)
+        return self.default(obj, item)
+
+
+def make_events(count, seed=0):
+    rand = random.Random(seed)
+    population = [(event_type, source) for (event_type, source, weight)
+                  in EVENT_MIX for _ in range(weight)]
+    course = 'course-v1:org+course+run'
+    events = []
+    for _ in range(count):
+        (event_type, source) = rand.choice(population)
+        events.append({
+            'event_type': event_type.format(course=course),
+            'event_source': source,
+            'context': {'course_id': course},
+        })
+    return events
+
+
+def noop(obj, item):
+    pass
+
+
+def stub_registry(registry_class):
+    """Copy the LogParser handlers with no-op bodies to time dispatch only."""
+    registry = registry_class()
+    for (kwargs, _) in LogParser.handler.handlers:
+        registry.add(**kwargs)(noop)
+    return registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    params = parser.parse_args()
+
+    events = make_events(params.events)
+    lines = ['host tracking: ' + json.dumps(item) for item in events]
+    parser_obj = LogParser.__new__(LogParser)
+    parser_obj.parsed_lines = parser_obj.skipped_lines = 0
+    parser_obj.encoding = None
+    handler = LogParser.handler
+    results = collections.OrderedDict()
+    try:
+        for registry_class in (LinearRegistry, Registry):
+            registry = stub_registry(registry_class)
+            name = registry_class.__name__
+
+            def dispatch():
+                for item in events:
+                    registry(None, item)
+
+            results[name] = min(timeit.repeat(
+                dispatch, number=1, repeat=params.repeat))
+
+            LogParser.handler = registry
+            results[name + ' + filter + decode'] = min(timeit.repeat(
+                lambda: parser_obj._parse(lines),
+                number=1, repeat=params.repeat))
+    finally:
+        LogParser.handler = handler
+
+    for (name, seconds) in results.items():
+        print('{:35} {:8.3f}s {:10.0f} events/s'.format(
+            name, seconds, params.events / seconds))
+    print('dispatch speedup {:.2f}x, with filter and decode {:.2f}x'.format(
+        results['LinearRegistry'] / results['Registry'],
+        results['LinearRegistry + filter + decode'] /
+        results['Registry + filter + decode']))
+
+
+if __name__ == '__main__':
+    main()
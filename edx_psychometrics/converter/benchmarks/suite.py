@@ -0,0 +1,196 @@
+"""
+Converter benchmark on synthetic logs of several sizes.
+
+Run from the converter directory:
+
+    $ python -m benchmarks.suite --scales small medium
+
+Every run is measured in a fresh process, so the peak RSS is its own.
+The results are appended to benchmarks/results.jsonl together with the
+commit, and compared with the last run of the same scale.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from answers import AnswersParser
+from course import CourseParser, CoursesParser
+from csv5 import process_all_csvs
+from logs import LogParser
+from sources import read_logs
+
+from benchmarks.generate import LogGenerator
+
+
+SCALES = {
+    'small': {'learners': 200, 'problems': 20, 'videos': 20, 'ora': 2},
+    'medium': {'learners': 2000, 'problems': 40, 'videos': 40, 'ora': 4},
+    'large': {'learners': 10000, 'problems': 80, 'videos': 60, 'ora': 8},
+}
+
+RESULTS = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+DATA_DIR = os.path.join(tempfile.gettempdir(), 'edx_psychometrics_bench')
+
+# metric: True if more is better
+METRICS = {
+    'lines_per_second': True,
+    'mb_per_second': True,
+    'parse_seconds': False,
+    'csv_seconds': False,
+    'peak_rss_mb': False,
+}
+
+
+def get_log(scale, data_dir, seed=0):
+    """Generate the log of the scale once and reuse it on later runs."""
+    params = SCALES[scale]
+    logname = os.path.join(data_dir, '{}-{}.log'.format(scale, '-'.join(
+        '{}{}'.format(key, value) for (key, value) in sorted(params.items()))
+        + '-seed{}'.format(seed)))
+    if not os.path.exists(logname):
+        logging.info('Generate %s', logname)
+        os.makedirs(data_dir, exist_ok=True)
+        with open(logname + '.tmp', 'w', encoding='utf8') as file:
+            LogGenerator(seed=seed, **params).write(file)
+        os.replace(logname + '.tmp', logname)
+    return logname
+
+
+def get_peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def measure(logname, output_format='csv'):
+    size = os.path.getsize(logname)
+    start = time.perf_counter()
+    parser = LogParser(read_logs([logname]), CourseParser([]),
+                       AnswersParser([]), CoursesParser([]), encoding='utf8')
+    parse_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as output:
+        start = time.perf_counter()
+        process_all_csvs(os.path.join(output, 'bench'), 'utf8', parser,
+                         output_format=output_format)
+        csv_seconds = time.perf_counter() - start
+
+    lines = parser.parsed_lines + parser.skipped_lines
+    return {
+        'lines': lines,
+        'megabytes': round(size / 2 ** 20, 2),
+        'parse_seconds': round(parse_seconds, 3),
+        'lines_per_second': round(lines / parse_seconds),
+        'mb_per_second': round(size / 2 ** 20 / parse_seconds, 2),
+        'csv_seconds': round(csv_seconds, 3),
+        'peak_rss_mb': round(get_peak_rss_mb(), 1),
+    }
+
+
+def measure_in_process(logname, output_format):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.suite', '--measure', logname,
+         '--format', output_format],
+        check=True, stdout=subprocess.PIPE,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(output.stdout.decode('utf8'))
+
+
+def get_commit():
+    try:
+        output = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.decode('ascii').strip()
+
+
+def load_results(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename, encoding='utf8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def find_previous(results, scale, output_format):
+    for result in reversed(results):
+        if (result['scale'] == scale and
+                result.get('format', 'csv') == output_format):
+            return result
+    return None
+
+
+def format_result(result, previous):
+    cells = ['{:8} {:>9} lines'.format(result['scale'], result['lines'])]
+    for (metric, more_is_better) in METRICS.items():
+        value = result[metric]
+        cell = '{} {}'.format(metric, value)
+        if previous is not None and previous.get(metric):
+            change = (value - previous[metric]) / previous[metric] * 100
+            cell += ' ({:+.1f}%{})'.format(
+                change, '' if abs(change) < 5 or
+                (change > 0) == more_is_better else ' !')
+        cells.append(cell)
+    return '\n    '.join(cells)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', nargs='+', choices=sorted(SCALES),
+                        default=['small', 'medium'])
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='Output format of the converter')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per scale, the fastest is kept')
+    parser.add_argument('--results', default=RESULTS,
+                        help='File the results are appended to')
+    parser.add_argument('--data-dir', default=DATA_DIR,
+                        help='Directory for the generated logs')
+    parser.add_argument('--no-save', action='store_true',
+                        help='Compare only, do not append the results')
+    parser.add_argument('--measure', metavar='LOG', help=argparse.SUPPRESS)
+    params = parser.parse_args()
+
+    if params.measure:
+        logging.disable(logging.WARNING)
+        print(json.dumps(measure(params.measure, params.format)))
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    history = load_results(params.results)
+    run = {
+        'commit': get_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'format': params.format,
+    }
+    results = []
+    for scale in params.scales:
+        logname = get_log(scale, params.data_dir)
+        result = dict(run, scale=scale, params=SCALES[scale])
+        result.update(min(
+            (measure_in_process(logname, params.format)
+             for _ in range(params.repeat)),
+            key=lambda measured: measured['parse_seconds']))
+        print(format_result(
+            result, find_previous(history, scale, params.format)))
+        results.append(result)
+
+    if not params.no_save:
+        with open(params.results, 'a', encoding='utf8') as file:
+            for result in results:
+                file.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
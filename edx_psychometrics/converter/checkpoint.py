@@ -0,0 +1,65 @@
+import gzip
+import logging
+import os
+import pickle
+import tempfile
+import time
+
+
+__all__ = ['Checkpoint']
+
+
+class Checkpoint:
+    """
+    Snapshot of the parser state and the log position reached, stored in
+    a gzip compressed pickle.
+
+    `update` is called after every batch of log lines and saves the
+    snapshot once `interval` seconds passed since the last one.
+    """
+    VERSION = 4
+
+    def __init__(self, filename, interval=600):
+        self.filename = filename
+        self.interval = interval
+        self.saved = time.monotonic()
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def load(self):
+        """Return the parser state and the log position of the snapshot."""
+        with gzip.open(self.filename, 'rb') as file:
+            snapshot = pickle.load(file)
+        if snapshot.get('version') != self.VERSION:
+            raise ValueError(
+                'Unsupported checkpoint version: {}'.format(
+                    snapshot.get('version')))
+        return (snapshot['state'], snapshot['position'])
+
+    def save(self, parser, position):
+        snapshot = {
+            'version': self.VERSION,
+            'state': parser.get_state(),
+            'position': position,
+        }
+        # write to a temporary file next to the checkpoint and rename it,
+        # so a crash while saving keeps the previous snapshot
+        (fd, tmpname) = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.filename)),
+            prefix=os.path.basename(self.filename), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='wb',
+                                  compresslevel=1) as file:
+                pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpname, self.filename)
+        except BaseException:
+            os.remove(tmpname)
+            raise
+        self.saved = time.monotonic()
+        logging.info('Saved checkpoint %s', self.filename)
+
+    def update(self, parser, position):
+        if time.monotonic() - self.saved >= self.interval:
+            self.save(parser, position)
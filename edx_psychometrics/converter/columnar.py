@@ -0,0 +1,131 @@
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from models import encode_time
+from utils import convert_datetime
+
+
+__all__ = ['ParquetWriter']
+
+
+# Column kinds of the 5CSV tables. Strings are dictionary encoded in the
+# file, so the ids are stored as integer references to one copy each.
+# The user ids are the numeric ids of the event context.
+COLUMN_KINDS = {
+    'user_id': 'id',
+    'reviewer_id': 'id',
+    'correct': 'flag',
+    'viewed': 'flag',
+    'module_order': 'int',
+    'score': 'int',
+    'max_score': 'int',
+    'time': 'time',
+}
+
+
+def _convert_flags(values):
+    return pyarrow.array([int(value) for value in values], pyarrow.uint8())
+
+
+def _convert_ints(values):
+    return pyarrow.array([int(value) for value in values], pyarrow.int64())
+
+
+def _convert_ids(values):
+    ids = [int(value) if str(value).isdecimal() else None for value in values]
+    dropped = [value for (value, id_) in zip(values, ids) if id_ is None]
+    if dropped:
+        logging.warning('Stored %d non-numeric user ids as null, '
+                        'the first is %r', len(dropped), dropped[0])
+    return pyarrow.array(ids, pyarrow.int64())
+
+
+def _encode_time(value):
+    # the times of the 5CSV format, or the ISO 8601 event times which are
+    # written as they are, like those of the server problem_check events
+    epoch = encode_time(value)
+    if epoch is None and value:
+        try:
+            epoch = encode_time(convert_datetime(value))
+        except ValueError:
+            pass
+    return epoch
+
+
+def _convert_times(values):
+    epochs = [_encode_time(value) for value in values]
+    dropped = [value for (value, epoch) in zip(values, epochs)
+               if epoch is None and value]
+    if dropped:
+        logging.warning('Stored %d times of an unknown format as null, '
+                        'the first is %r', len(dropped), dropped[0])
+    return pyarrow.array(epochs, pyarrow.int64())
+
+
+def _convert_strings(values):
+    return pyarrow.array(values, pyarrow.string())
+
+
+def _get_column_type(kind):
+    return {
+        'flag': pyarrow.uint8(),
+        'int': pyarrow.int64(),
+        'id': pyarrow.int64(),
+        'time': pyarrow.int64(),
+    }.get(kind, pyarrow.string())
+
+
+CONVERTERS = {
+    'flag': _convert_flags,
+    'int': _convert_ints,
+    'id': _convert_ids,
+    'time': _convert_times,
+}
+
+
+class ParquetWriter:
+    """
+    Writes the rows of a 5CSV table to a compressed Parquet file.
+
+    The rows are the string cells of the CSV writer. Flags are stored as
+    uint8, numbers and user ids as int64 and times as int64 epoch seconds (UTC).
+    """
+    ROW_GROUP_SIZE = 128 * 1024
+
+    def __init__(self, filename, columns):
+        if pyarrow is None:
+            raise RuntimeError('The parquet output format requires pyarrow')
+        self.name = filename
+        self.kinds = [COLUMN_KINDS.get(name, 'string') for name in columns]
+        self.schema = pyarrow.schema([
+            pyarrow.field(name, _get_column_type(kind))
+            for (name, kind) in zip(columns, self.kinds)])
+        self._writer = pyarrow.parquet.ParquetWriter(
+            filename, self.schema, compression='snappy', use_dictionary=[
+                name for (name, kind) in zip(columns, self.kinds)
+                if kind == 'string'])
+        self._rows = []
+
+    def writerows(self, rows):
+        self._rows.extend(rows)
+        if len(self._rows) >= self.ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = list(zip(*self._rows)) or [()] * len(self.kinds)
+        arrays = [CONVERTERS.get(kind, _convert_strings)(values)
+                  for (kind, values) in zip(self.kinds, columns)]
+        self._writer.write_table(
+            pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
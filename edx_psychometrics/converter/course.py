@@ -33,6 +33,15 @@ class CourseParser:
         self.content = {}
         self._parse(course)
 
+    def for_course(self, course_name):
+        course = CourseParser([])
+        course.modules.update(self.modules)
+        course.content = {
+            content_id: module_id
+            for (content_id, module_id) in self.content.items()
+            if utils.in_course(content_id, course_name)}
+        return course
+
     def _parse(self, course):
         for (i, item) in enumerate(csv.reader(course, delimiter=';')):
             if len(item) < 2:
@@ -1,11 +1,16 @@
 import abc
+import collections
 import contextlib
 import csv
+import functools
 import json
 import logging
 import operator
 import os.path
 
+from columnar import ParquetWriter
+from utils import nullcontext
+
 __all__ = ['process_all_csvs']
 
 
@@ -26,24 +31,62 @@ class BaseProcessor(metaclass=abc.ABCMeta):
 
 class BaseCSVProcessor(BaseProcessor):
     COLUMNS = []
-
-    def __init__(self, prefix, index, encoding):
-        super(BaseCSVProcessor, self).__init__('{}{}.csv'.format(prefix, index), encoding)
-        self._csv = csv.writer(self._file, delimiter=';')
-        self._csv.writerow(map(operator.itemgetter(0), self.COLUMNS))
+    BATCH_SIZE = 1024
+    SAMPLES = 3
+
+    def __init__(self, prefix, index, encoding, output_format='csv'):
+        if output_format == 'parquet':
+            self._file = ParquetWriter(
+                '{}{}.parquet'.format(prefix, index),
+                list(map(operator.itemgetter(0), self.COLUMNS)))
+            self._csv = self._file
+        else:
+            super(BaseCSVProcessor, self).__init__('{}{}.csv'.format(prefix, index), encoding)
+            self._csv = csv.writer(self._file, delimiter=';')
+            self._csv.writerow(map(operator.itemgetter(0), self.COLUMNS))
+        self._validate = compile_validator(tuple(self.COLUMNS))
+        self._rows = []
+        self.invalid = collections.Counter()
+        self.samples = collections.defaultdict(list)
 
     def write(self, *items):
         row = tuple(map(str, items))
-        for (item, (name, checker)) in zip(row, self.COLUMNS):
-            if not checker(item):
-                logging.warning('Invalid item "%s" in %s. Skip', name, row)
-                return
-        self._csv.writerow(row)
+        if len(row) == len(self.COLUMNS):
+            invalid = self._validate(row)
+        else:
+            invalid = next((
+                i for (i, (item, (_, checker)))
+                in enumerate(zip(row, self.COLUMNS)) if not checker(item)),
+                None)
+        if invalid is not None:
+            (name, checker) = self.COLUMNS[invalid]
+            key = (name, checker.__name__)
+            self.invalid[key] += 1
+            if len(self.samples[key]) < self.SAMPLES:
+                self.samples[key].append(row)
+            return
+
+        self._rows.append(row)
+        if len(self._rows) >= self.BATCH_SIZE:
+            self.flush()
 
     def writeiter(self, iterable):
         for item in iterable:
             self.write(*item)
 
+    def flush(self):
+        self._csv.writerows(self._rows)
+        self._rows = []
+
+    def __exit__(self, *exc_info):
+        self.flush()
+        for ((name, reason), count) in sorted(self.invalid.items()):
+            logging.warning(
+                'Skip %d rows of %s with invalid "%s" (%s), e.g. %s',
+                count, os.path.basename(self._file.name), name, reason,
+                '; '.join(map(str, self.samples[(name, reason)])))
+        super(BaseCSVProcessor, self).__exit__(*exc_info)
+
 
 class Checkers:
     @staticmethod
@@ -71,6 +114,46 @@ class Checkers:
         return False
 
 
+# Checkers of the string cells as expressions of `{0}`, which fall back
+# to the checker function for the uncommon number formats
+INLINE_CHECKERS = {
+    Checkers.nonempty: '{0}',
+    Checkers.non_empty_or_none: "{0} and {0} != 'None'",
+    Checkers.zero_or_one: "{0} in ('0', '1')",
+    Checkers.positive_int:
+        '{0}.isdecimal() and int({0}) > 0 or positive_int({0})',
+    Checkers.nonnegative_int: '{0}.isdecimal() or nonnegative_int({0})',
+}
+
+
+@functools.lru_cache(maxsize=None)
+def compile_validator(columns):
+    """
+    Compile the checkers of the columns into one function, which returns
+    the index of the first invalid cell of a row or None.
+    """
+    namespace = {
+        'positive_int': Checkers.positive_int,
+        'nonnegative_int': Checkers.nonnegative_int,
+    }
+    lines = ['def validate(row):']
+    if columns:
+        lines.append('    ({}{}) = row'.format(
+            ', '.join('c{}'.format(i) for i in range(len(columns))),
+            ',' if len(columns) == 1 else ''))
+    for (i, (_, checker)) in enumerate(columns):
+        expression = INLINE_CHECKERS.get(checker)
+        if expression is None:
+            namespace['checker{}'.format(i)] = checker
+            expression = 'checker{}({{0}})'.format(i)
+        lines.append('    if not ({}):'.format(
+            expression.format('c{}'.format(i))))
+        lines.append('        return {}'.format(i))
+    lines.append('    return None')
+    exec('\n'.join(lines), namespace)
+    return namespace['validate']
+
+
 class Items:
     USER_ID = ('user_id', Checkers.nonempty)
     REVIEWER_ID = ('reviewer_id', Checkers.nonempty)
@@ -99,8 +182,8 @@ class CSV1(BaseCSVProcessor):
     COLUMNS = [
         Items.USER_ID, Items.ITEM_ID, Items.CORRECT, Items.TIME]
 
-    def __init__(self, prefix, encoding):
-        super(CSV1, self).__init__(prefix, 1, encoding)
+    def __init__(self, prefix, encoding, **kwargs):
+        super(CSV1, self).__init__(prefix, 1, encoding, **kwargs)
 
     def process(self, parser):
         self.writeiter(parser.get_student_solutions())
@@ -111,8 +194,8 @@ class CSV2(BaseCSVProcessor):
         Items.ITEM_ID, Items.ITEM_TYPE, Items.ITEM_NAME,
         Items.MODULE_ID, Items.MODULE_ORDER, Items.MODULE_NAME]
 
-    def __init__(self, prefix, encoding):
-        super(CSV2, self).__init__(prefix, 2, encoding)
+    def __init__(self, prefix, encoding, **kwargs):
+        super(CSV2, self).__init__(prefix, 2, encoding, **kwargs)
 
     def process(self, parser):
         self.writeiter(parser.get_tasks())
@@ -121,20 +204,27 @@ class CSV2(BaseCSVProcessor):
 class CSV3(BaseCSVProcessor):
     COLUMNS = [Items.USER_ID, Items.CONTENT_ID, Items.VIEWED]
 
-    def __init__(self, prefix, encoding):
-        super(CSV3, self).__init__(prefix, 3, encoding)
+    def __init__(self, prefix, encoding, **kwargs):
+        super(CSV3, self).__init__(prefix, 3, encoding, **kwargs)
 
     def process(self, parser):
         self.writeiter(parser.get_student_content())
 
 
+class SparseCSV3(CSV3):
+    """CSV3 with the viewed content rows only, the rest is in CSV4."""
+
+    def process(self, parser):
+        self.writeiter(parser.get_student_content(sparse=True))
+
+
 class CSV4(BaseCSVProcessor):
     COLUMNS = [
         Items.CONTENT_ID, Items.CONTENT_TYPE, Items.CONTENT_NAME,
         Items.MODULE_ID, Items.MODULE_ORDER, Items.MODULE_NAME]
 
-    def __init__(self, prefix, encoding):
-        super(CSV4, self).__init__(prefix, 4, encoding)
+    def __init__(self, prefix, encoding, **kwargs):
+        super(CSV4, self).__init__(prefix, 4, encoding, **kwargs)
 
     def process(self, parser):
         self.writeiter(parser.get_content())
@@ -145,15 +235,15 @@ class CSV5(BaseCSVProcessor):
         Items.USER_ID, Items.ITEM_ID, Items.REVIEWER_ID,
         Items.SCORE, Items.MAX_SCORE]
 
-    def __init__(self, prefix, encoding):
-        super(CSV5, self).__init__(prefix, 5, encoding)
+    def __init__(self, prefix, encoding, **kwargs):
+        super(CSV5, self).__init__(prefix, 5, encoding, **kwargs)
 
     def process(self, parser):
         self.writeiter(parser.get_assessments())
 
 
 class CourseInfoJSON(BaseProcessor):
-    def __init__(self, prefix, encoding):
+    def __init__(self, prefix, encoding, **kwargs):
         super(CourseInfoJSON, self).__init__(
             os.path.join(os.path.dirname(prefix), 'course.json'), encoding)
 
@@ -161,7 +251,12 @@ class CourseInfoJSON(BaseProcessor):
         json.dump(parser.get_course_info(), self._file)
 
 
-def process_all_csvs(prefix, encoding, parser):
-    for processor in (CSV1, CSV2, CSV3, CSV4, CSV5, CourseInfoJSON):
-        with processor(prefix, encoding) as p:
+def process_all_csvs(prefix, encoding, parser, *, sparse=False,
+                     output_format='csv', stats=None):
+    csv3 = SparseCSV3 if sparse else CSV3
+    for processor in (CSV1, CSV2, csv3, CSV4, CSV5, CourseInfoJSON):
+        timer = (stats.timer(processor.__name__) if stats is not None
+                 else nullcontext())
+        with timer, processor(
+                prefix, encoding, output_format=output_format) as p:
             p.process(parser)
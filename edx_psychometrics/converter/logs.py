@@ -1,22 +1,27 @@
 import collections
 import csv
+import functools
 import json
 import logging
 import re
 
 from models import Users, Tasks, Modules, Content
-from utils import get_item, get_items, convert_datetime, get_id, Registry
+from storage import MemoryStore
+from utils import (get_item, get_items, convert_datetime, get_id,
+                   get_course_name, nullcontext, Registry)
 
 
-__all__ = ['LogParser']
+__all__ = ['LogParser', 'MultiCourseLogParser']
 
 
 class LogParser:
     handler = Registry()
+    stats = None
+    storage = MemoryStore
 
     def _update_course(self, item):
         self.course_name = (
-            get_item(item, 'context.course_id').split(':', 1)[-1]
+            get_course_name(get_item(item, 'context.course_id'))
             or self.course_name)
 
     @handler.add(event_type=['load_video', 'edx.video.loaded'])
@@ -82,27 +87,157 @@ class LogParser:
             for score in scores)
         self.users.assess(submission_id, user_id, points, max_points)
 
-    def __init__(self, log, course, answers, courses):
+    STATE = ('course_name', 'parsed_lines', 'skipped_lines',
+             'users', 'tasks', 'modules', 'content')
+
+    def __init__(self, log, course, answers, courses, *,
+                 encoding=None, state=None, checkpoint=None, stats=None,
+                 storage=None):
+        """
+        `log` yields the log lines, as bytes in `encoding` if it is given.
+
+        Parsing continues from the `state` of a checkpoint if it is given.
+        With a `checkpoint` the `log` is a LogReader, and the state is saved
+        together with its position while parsing and at the end of the log.
+        The handlers and stages of the run are timed in `stats` if given.
+        `storage` creates the store of the users activity, a MemoryStore
+        by default.
+        """
+        self.encoding = encoding
+        if storage is not None:
+            self.storage = storage
+        self._init_models()
+        if state is not None:
+            self.__dict__.update(state)
+        self.stats = stats
+
+        if checkpoint is not None:
+            log.on_batch = functools.partial(checkpoint.update, self)
+        with self._timer('parse'):
+            self._parse(log)
+        logging.info('Parsed %d log lines, skipped %d',
+                     self.parsed_lines, self.skipped_lines)
+        if checkpoint is not None:
+            checkpoint.save(self, log.position)
+
+        with self._timer('update_data'):
+            self._update_data(course, answers, courses)
+        if stats is not None:
+            stats.tick(force=True)
+
+    def _timer(self, stage):
+        if self.stats is None:
+            return nullcontext()
+        return self.stats.timer(stage)
+
+    def _init_models(self):
         self.course_name = ''
-        self.users = Users()
+        self.parsed_lines = 0
+        self.skipped_lines = 0
+        self.users = Users(self.storage())
         self.tasks = Tasks()
         self.modules = Modules()
         self.content = Content()
 
-        self._parse(log)
+    def close(self):
+        """Release the store of the users activity."""
+        self.users.close()
 
+    def get_state(self):
+        return {name: getattr(self, name) for name in self.STATE}
+
+    def _update_data(self, course, answers, courses):
         for item in (self.users, self.tasks, self.modules, self.content):
             item.update_data(course, answers)
 
         self.course_long_name = courses[self.course_name]
 
+    @classmethod
+    def get_line_filter(cls, *, binary=False):
+        """
+        Return a search function matching the lines which may hold an event
+        with a handler, or None if any line may have one.
+
+        The lines are searched for the quoted event types the handlers are
+        registered for, so the rest are skipped without decoding.
+        """
+        (key, values) = cls.handler.get_keys()
+        if key != 'event_type' or values is None:
+            return None
+        pattern = '|'.join(
+            re.escape(json.dumps(value)) for value in sorted(values))
+        return re.compile(
+            pattern.encode('ascii') if binary else pattern).search
+
     def _parse(self, log):
+        if self.stats is not None:
+            return self._parse_profiled(log)
+        encoding = self.encoding
+        match = self.get_line_filter(binary=encoding is not None)
         for (i, line) in enumerate(log):
+            if match is not None and match(line) is None:
+                self.skipped_lines += 1
+                continue
+            self.parsed_lines += 1
             try:
+                if encoding is not None:
+                    line = line.decode(encoding)
                 item = json.loads(line.split(':', maxsplit=1)[-1])
-                LogParser.handler(self, item)
+                self._dispatch(item)
+            except Exception as e:
+                self._log_error(i, e)
+
+    def _parse_profiled(self, log):
+        # _parse timing every step, kept apart so that _parse stays fast
+        (stats, clock) = (self.stats, self.stats.clock)
+        (handler, encoding) = (LogParser.handler, self.encoding)
+        match = self.get_line_filter(binary=encoding is not None)
+        for (i, line) in enumerate(log):
+            stats.add_line(len(line))
+            if match is not None and match(line) is None:
+                self.skipped_lines += 1
+                continue
+            self.parsed_lines += 1
+            start = clock()
+            try:
+                if encoding is not None:
+                    line = line.decode(encoding)
+                item = json.loads(line.split(':', maxsplit=1)[-1])
+                decoded = clock()
+                target = self._get_target(item)
+                func = handler.resolve(item)
+            except Exception as e:
+                stats.add_time('decode', clock() - start)
+                stats.add_decode_error(e)
+                self._log_error(i, e)
+                continue
+            dispatched = clock()
+            stats.add_time('decode', decoded - start)
+            stats.add_time('dispatch', dispatched - decoded)
+            if target is None:
+                continue
+
+            error = None
+            try:
+                func(target, item)
             except Exception as e:
-                logging.warning('Error on process entry, line %d: %s', i, e)
+                error = e
+                self._log_error(i, e)
+            stats.add_call(
+                'default' if func is handler.default else func.__name__,
+                clock() - dispatched, error)
+
+    def _log_error(self, line, error):
+        logging.warning('Error on process entry, line %d: %s', line, error)
+
+    def _get_target(self, item):
+        """Return the parser the item is handled by, None to skip it."""
+        return self
+
+    def _dispatch(self, item):
+        target = self._get_target(item)
+        if target is not None:
+            LogParser.handler(target, item)
 
     def get_course_info(self):
         return {
@@ -112,24 +247,44 @@ class LogParser:
 
     def get_student_solutions(self, user_id=None):
         if user_id is None:
-            for userid in self.users.submits:
-                yield self.get_student_solutions(userid)
+            for (userid, taskid, time, correct) in self.users.iter_submits():
+                yield (userid, taskid, correct, time)
         else:
-            submits = self.users.submits[user_id]
-            for (taskid, tries) in submits.items():
-                for (time, correct) in tries:
-                    yield (user_id, taskid, correct, time)
+            for (taskid, time, correct) in self.users.get_submits(user_id):
+                yield (user_id, taskid, correct, time)
+
+    def get_module_content(self):
+        """Return the ids of the content found in the course modules."""
+        return [content_id
+                for content in self.content.content.values()
+                for content_id in content
+                if self.modules.get_content_module(content_id)]
 
-    def get_student_content(self, user_id=None):
+    def get_student_content(self, user_id=None, *, sparse=False,
+                            content_ids=None):
+        """
+        Yield `(user_id, content_id, viewed)` for the module content, or
+        only the rows of the viewed content if `sparse` is set.
+        """
+        if content_ids is None:
+            content_ids = self.get_module_content()
+        if sparse and not isinstance(content_ids, dict):
+            content_ids = {content_id: order
+                           for (order, content_id) in enumerate(content_ids)}
         if user_id is None:
-            for userid in self.users.viewed_content:
-                yield self.get_student_content(userid)
+            viewed_content = self.users.iter_viewed()
         else:
-            viewed = self.users.viewed_content[user_id]
-            for (_, content) in self.content.content.items():
-                for content_id in content:
-                    if self.modules.get_content_module(content_id):
-                        yield (user_id, content_id, int(content_id in viewed))
+            viewed_content = [
+                (user_id, self.users.get_viewed_content(user_id))]
+        for (userid, viewed) in viewed_content:
+            if sparse:
+                viewed = [content_id for content_id in viewed
+                          if content_id in content_ids]
+                for content_id in sorted(viewed, key=content_ids.get):
+                    yield (userid, content_id, 1)
+            else:
+                for content_id in content_ids:
+                    yield (userid, content_id, int(content_id in viewed))
 
     def get_assessments(self):
         for submission_id in self.users.pr_submits:
@@ -143,7 +298,7 @@ class LogParser:
         if task_id is None:
             task_ids = set(self.tasks.tasks) | set(self.tasks.assessments)
             for taskid in task_ids:
-                yield self.get_tasks(taskid)
+                yield from self.get_tasks(taskid)
         else:
             module = self.modules.get_task_module(task_id)
             if not module:
@@ -152,14 +307,61 @@ class LogParser:
                 for subtask in self.tasks.tasks[task_id]:
                     text = self.tasks.subtask_text.get(subtask) or 'NA'
                     yield (subtask, self.tasks.subtask_type[subtask],
-                           text, module)
+                           text) + module
             if task_id in self.tasks.assessments:
                 name = self.tasks.assessments[task_id] or 'NA'
-                yield (get_id(task_id), 'openassessment', name, module)
+                yield (get_id(task_id), 'openassessment', name) + module
 
     def get_content(self):
         for (content_type, content) in self.content.content.items():
             for content_id in content:
                 module = self.modules.get_content_module(content_id)
                 if module:
-                    yield (content_id, content_type, 'NA', module)
+                    yield (content_id, content_type, 'NA') + module
+
+
+class MultiCourseLogParser(LogParser):
+    """
+    Splits the log by `context.course_id` in one pass.
+
+    `parsers` maps the course names to LogParsers with the models of one
+    course each. Only the courses in `course_names` are kept if it is
+    given, events with no course are skipped.
+    """
+
+    STATE = LogParser.STATE + ('parsers',)
+
+    def __init__(self, log, course, answers, courses, *,
+                 course_names=None, **kwargs):
+        self.course_names = (
+            {get_course_name(name) for name in course_names}
+            if course_names else None)
+        self.parsers = collections.OrderedDict()
+        super().__init__(log, course, answers, courses, **kwargs)
+
+    def _get_parser(self, course_name):
+        parser = self.parsers.get(course_name)
+        if parser is None:
+            parser = LogParser.__new__(LogParser)
+            parser.storage = self.storage
+            parser._init_models()
+            parser.course_name = course_name
+            self.parsers[course_name] = parser
+        return parser
+
+    def _get_target(self, item):
+        course_name = get_course_name(get_item(item, 'context.course_id'))
+        if not course_name or (self.course_names is not None
+                               and course_name not in self.course_names):
+            return None
+        return self._get_parser(course_name)
+
+    def close(self):
+        super().close()
+        for parser in self.parsers.values():
+            parser.close()
+
+    def _update_data(self, course, answers, courses):
+        for (course_name, parser) in self.parsers.items():
+            parser._update_data(course.for_course(course_name),
+                                answers.for_course(course_name), courses)
@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
+import logging
 import os.path
 import sys
 
+from checkpoint import Checkpoint
 from course import CourseParser, CoursesParser
 from answers import AnswersParser
-from logs import LogParser
+from logs import LogParser, MultiCourseLogParser
+from parallel import ParallelLogParser
 from csv5 import process_all_csvs
+from sources import find_logs, LogReader
+from stats import RunStats
+from storage import STORES
+from utils import get_course_dirnames
 
 
 def parse_args():
@@ -15,20 +23,83 @@ def parse_args():
     parser.add_argument(
         '-e', '--encoding', type=str, default='utf8', help='Files encoding')
     parser.add_argument(
-        '-l', '--logs', type=str, required=True, help='Log file')
+        '-l', '--logs', type=str, action='append', required=True,
+        help='Log file, directory or glob pattern, may be repeated; '
+             'the files may be compressed with gzip, bzip2 or xz')
     parser.add_argument(
         '-c', '--course', type=str, help='Course structure file')
     parser.add_argument(
         '-a', '--answers', type=str, help='Student answers file')
     parser.add_argument(
         '-C', '--courses', type=str, help='Course names file')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='Number of processes parsing the log file, '
+             'cannot be used with --split-courses')
+    parser.add_argument(
+        '-s', '--split-courses', action='store_true',
+        help='Write the 5CSV of every course to its own output subdirectory')
+    parser.add_argument(
+        '-i', '--course-id', type=str, action='append',
+        help='Course to split out of the log, may be repeated')
+    parser.add_argument(
+        '-f', '--format', type=str, choices=('csv', 'parquet'),
+        default='csv', help='Output tables format')
+    parser.add_argument(
+        '--sparse', action='store_true',
+        help='Write only the viewed content to csv3, '
+             'all the content is listed in csv4')
+    parser.add_argument(
+        '--checkpoint', type=str,
+        help='File to save the parser state to while the logs are parsed')
+    parser.add_argument(
+        '--checkpoint-interval', type=int, default=600,
+        help='Seconds between the checkpoints')
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='Continue from the checkpoint, skipping the log data read')
+    parser.add_argument(
+        '--storage', type=str, choices=sorted(STORES), default='memory',
+        help='Where the users activity is kept while the logs are parsed, '
+             'sqlite keeps it in a temporary database file')
+    parser.add_argument(
+        '--storage-dir', type=str,
+        help='Directory for the sqlite storage files, '
+             'the system temporary directory by default')
+    parser.add_argument(
+        '--stats', type=str,
+        help='File to write the JSON summary of the handler and stage '
+             'timings to')
+    parser.add_argument(
+        '--progress', type=int, metavar='SECONDS',
+        help='Print the parsing throughput to stderr every SECONDS')
     parser.add_argument('output', type=str, help='Output csv prefix')
-    return parser.parse_args()
+    params = parser.parse_args()
+    if params.resume and not params.checkpoint:
+        parser.error('--resume requires --checkpoint')
+    if params.checkpoint and params.jobs > 1:
+        parser.error('--checkpoint cannot be used with --jobs')
+    if (params.split_courses or params.course_id) and params.jobs > 1:
+        parser.error('--split-courses and --course-id cannot be used '
+                     'with --jobs')
+    if params.checkpoint and params.storage != 'memory':
+        parser.error('--checkpoint requires the memory storage')
+    return params
 
 
 def main():
     params = parse_args()
+    stats = None
+    if params.stats or params.progress:
+        stats = RunStats(progress_interval=params.progress)
+    try:
+        convert(params, stats)
+    finally:
+        if params.stats:
+            stats.dump(params.stats)
+
 
+def convert(params, stats):
     optional_data_source = [
         (params.course, CourseParser),
         (params.answers, AnswersParser),
@@ -42,19 +113,57 @@ def main():
         else:
             optional_source.append(parser([]))
 
-    with open(params.logs, encoding=params.encoding) as logfile:
-        parser = LogParser(logfile, *optional_source)
+    logs = find_logs(params.logs)
+    (state, position, checkpoint) = (None, None, None)
+    if params.checkpoint:
+        checkpoint = Checkpoint(
+            params.checkpoint, params.checkpoint_interval)
+        if params.resume and checkpoint.exists():
+            (state, position) = checkpoint.load()
+    log = LogReader(logs, position)
+    storage = STORES[params.storage]
+    if params.storage_dir:
+        storage = functools.partial(storage, params.storage_dir)
+
+    if params.split_courses or params.course_id:
+        parser = MultiCourseLogParser(
+            log, *optional_source, encoding=params.encoding,
+            course_names=params.course_id,
+            state=state, checkpoint=checkpoint, stats=stats,
+            storage=storage)
+        dirnames = get_course_dirnames(parser.parsers)
+        for (course_name, course_parser) in parser.parsers.items():
+            outdir = os.path.join(params.output, dirnames[course_name])
+            os.makedirs(outdir, exist_ok=True)
+            process_all_csvs(
+                os.path.join(outdir, 'csv'), params.encoding, course_parser,
+                sparse=params.sparse, output_format=params.format,
+                stats=stats)
+        parser.close()
+        return
+    elif params.jobs > 1:
+        parser = ParallelLogParser(
+            logs, *optional_source,
+            jobs=params.jobs, encoding=params.encoding, stats=stats,
+            storage=storage)
+    else:
+        parser = LogParser(
+            log, *optional_source, encoding=params.encoding,
+            state=state, checkpoint=checkpoint, stats=stats,
+            storage=storage)
 
     if os.path.isdir(params.output):
         params.output = os.path.join(params.output, 'csv')
 
     process_all_csvs(
-        params.output, params.encoding, parser)
+        params.output, params.encoding, parser, sparse=params.sparse,
+        output_format=params.format, stats=stats)
+    parser.close()
 
 
 if __name__ == '__main__':
     try:
         sys.exit(main())
     except Exception as e:
-        # print(e, file=sys.stderr)
+        logging.exception(e)
         sys.exit(1)
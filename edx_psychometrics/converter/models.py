@@ -1,8 +1,12 @@
 import abc
+import calendar
 import collections
+import functools
 import re
+import time
 
 import utils
+from storage import MemoryStore
 
 MODULE_URL = re.compile(r'([^#?]*/)')
 
@@ -15,6 +19,30 @@ def get_module_id(url):
     return list(filter(None, url.split('/')))[-2]
 
 
+@functools.lru_cache(maxsize=65536)
+def encode_time(timestr):
+    """
+    Return the epoch of the `dd.mm.YYYY HH:MM:SS` time, or None for the
+    strings which would not be decoded back the same.
+    """
+    if (len(timestr) != 19 or timestr[2] != '.' or timestr[5] != '.'
+            or timestr[10] != ' ' or timestr[13] != ':' or timestr[16] != ':'):
+        return None
+    fields = (timestr[6:10], timestr[3:5], timestr[0:2],
+              timestr[11:13], timestr[14:16], timestr[17:19])
+    if not all(map(str.isdigit, fields)):
+        return None
+    epoch = calendar.timegm(tuple(map(int, fields)))
+    if decode_time(epoch) != timestr:
+        return None
+    return epoch
+
+
+@functools.lru_cache(maxsize=65536)
+def decode_time(epoch):
+    return time.strftime(Users.TIME_FORMAT, time.gmtime(epoch))
+
+
 class BaseModel(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def update_data(self, course, answers):
@@ -22,21 +50,67 @@ class BaseModel(metaclass=abc.ABCMeta):
 
 
 class Users(BaseModel):
-    def __init__(self):
-        self.times = collections.defaultdict(
-            lambda: collections.defaultdict(list))
-        self.submits = collections.defaultdict(
-            lambda: collections.defaultdict(list))
+    """
+    Users activity with the ids interned into an integer table.
+
+    The submits and views are kept in `store`, a `storage.MemoryStore`
+    unless another is given, as integer codes. Times are stored as
+    epochs, the time strings of another format as string codes below
+    `ODD_TIME`, or as they are if the store has `STRING_TIMES`. The
+    strings are decoded when the rows are read.
+    """
+    NO_TIME = -2 ** 63
+    ODD_TIME = -2 ** 62
+    TIME_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+    def __init__(self, store=None):
+        self._codes = {}
+        self._strings = []
+        self._store = store if store is not None else MemoryStore()
         self.pr_submits = {}
         self.assessments = collections.defaultdict(list)
-        self.viewed_content = collections.defaultdict(set)
+
+    def _intern(self, string):
+        code = self._codes.get(string)
+        if code is None:
+            code = self._codes[string] = len(self._strings)
+            self._strings.append(string)
+        return code
+
+    def _encode_time(self, time):
+        if time is None:
+            return self.NO_TIME
+        epoch = encode_time(time)
+        if epoch is None:
+            if self._store.STRING_TIMES:
+                return time
+            return self.ODD_TIME + self._intern(time)
+        return epoch
+
+    def _decode_time(self, time):
+        if isinstance(time, str):
+            return time
+        if time == self.NO_TIME:
+            return None
+        if time < self.ODD_TIME // 2:
+            return self._strings[time - self.ODD_TIME]
+        return decode_time(time)
 
     def post_solution(self, user_id, problem_id, time):
-        self.times[user_id][problem_id].append(time)
+        self._store.post_solution(
+            self._intern(user_id), self._intern(problem_id),
+            self._encode_time(time))
 
     def score_task(self, user_id, problem_id, subtask_id, correct, time=None):
-        time = (self.times[user_id][problem_id] or [time])[-1]
-        self.submits[user_id][subtask_id].append((time, int(correct)))
+        (user, problem) = (self._intern(user_id), self._intern(problem_id))
+        # the time is only encoded when no solution time replaces it, so
+        # that the raw event times of the server problem_check events are
+        # not interned for nothing
+        if self._store.has_solution(user, problem):
+            time = None
+        self._store.score_task(
+            user, problem, self._intern(subtask_id), int(correct),
+            self._encode_time(time))
 
     def create_submission(self, submission_id, user_id, problem_id):
         self.pr_submits[submission_id] = (user_id, problem_id)
@@ -45,12 +119,78 @@ class Users(BaseModel):
         self.assessments[submission_id].append((reviewer, score, max_score))
 
     def view_content(self, user_id, content_id):
-        self.viewed_content[user_id].add(content_id)
+        self._store.view_content(
+            self._intern(user_id), self._intern(content_id))
+
+    def get_submit_users(self):
+        return [self._strings[user]
+                for user in self._store.get_submit_users()]
+
+    def get_submits(self, user_id):
+        """
+        Yield `(subtask_id, time, correct)` of the user submits grouped by
+        subtask, in the order of the first submits.
+        """
+        user = self._codes.get(user_id)
+        if user is None:
+            return
+        for (subtask, time, correct) in self._store.get_submits(user):
+            yield (self._strings[subtask], self._decode_time(time), correct)
+
+    def iter_submits(self):
+        """
+        Yield `(user_id, subtask_id, time, correct)` of all the submits,
+        the users in the order of `get_submit_users`.
+        """
+        strings = self._strings
+        for (user, subtask, time, correct) in self._store.iter_submits():
+            yield (strings[user], strings[subtask],
+                   self._decode_time(time), correct)
+
+    def has_submits(self, user_id, subtask_id):
+        user = self._codes.get(user_id)
+        subtask = self._codes.get(subtask_id)
+        return (user is not None and subtask is not None
+                and self._store.has_submits(user, subtask))
+
+    def get_viewed_users(self):
+        return [self._strings[user]
+                for user in self._store.get_viewed_users()]
+
+    def get_viewed_content(self, user_id):
+        user = self._codes.get(user_id)
+        if user is None:
+            return set()
+        return {self._strings[content]
+                for content in self._store.get_viewed_content(user)}
+
+    def iter_viewed(self):
+        """Yield `(user_id, viewed content ids)` of all the users."""
+        for (user, viewed) in self._store.iter_viewed():
+            yield (self._strings[user],
+                   {self._strings[content] for content in viewed})
+
+    def close(self):
+        self._store.close()
+
+    @property
+    def submits(self):
+        submits = {}
+        for user_id in self.get_submit_users():
+            submits[user_id] = user_submits = {}
+            for (subtask_id, time, correct) in self.get_submits(user_id):
+                user_submits.setdefault(subtask_id, []).append((time, correct))
+        return submits
+
+    @property
+    def viewed_content(self):
+        return {user_id: self.get_viewed_content(user_id)
+                for user_id in self.get_viewed_users()}
 
     def update_data(self, course, answers):
         for (taskid, subtaskid, _, userid, time, correct) in answers.answers:
             time = utils.convert_datetime(time)
-            if not self.submits[userid][subtaskid]:
+            if not self.has_submits(userid, subtaskid):
                 self.post_solution(userid, taskid, time)
                 self.score_task(userid, taskid, subtaskid, correct)
 
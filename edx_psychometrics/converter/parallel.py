@@ -0,0 +1,175 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+
+from logs import LogParser
+from sources import iscompressed, open_log
+
+
+__all__ = ['ParallelLogParser']
+
+
+class ModelRecorder:
+    """Stands in for a model in a shard worker and records calls to it."""
+
+    def __init__(self, name, calls):
+        self._name = name
+        self._calls = calls
+
+    def __getattr__(self, method):
+        def record(*args):
+            self._calls.append((self._name, method, args))
+        return record
+
+
+class CallsFile:
+    """Appends the recorded calls to a file in pickled batches."""
+
+    BATCH_SIZE = 10000
+
+    def __init__(self, file):
+        self.file = file
+        self.batch = []
+
+    def append(self, call):
+        self.batch.append(call)
+        if len(self.batch) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            pickle.dump(self.batch, self.file, pickle.HIGHEST_PROTOCOL)
+            self.batch = []
+
+
+def read_calls(filename):
+    """Yield the calls of a CallsFile batch by batch."""
+    with open(filename, 'rb') as file:
+        while True:
+            try:
+                batch = pickle.load(file)
+            except EOFError:
+                return
+            yield from batch
+
+
+class ShardParser(LogParser):
+    """
+    Parses one shard of the log into the ordered model calls, written to
+    `calls`. The errors are recorded among them with the line number in
+    the shard, as the lines before it are not known here.
+    """
+
+    MODELS = ('users', 'tasks', 'modules', 'content')
+
+    def __init__(self, encoding, calls):
+        self.course_name = ''
+        self.encoding = encoding
+        self.parsed_lines = 0
+        self.skipped_lines = 0
+        self.calls = calls
+        for name in self.MODELS:
+            setattr(self, name, ModelRecorder(name, self.calls))
+
+    def _log_error(self, line, error):
+        self.calls.append((None, 'error', (line, str(error))))
+
+    def parse(self, lines):
+        self._parse(lines)
+        self.calls.flush()
+        return (self.course_name, self.parsed_lines, self.skipped_lines)
+
+
+def split_shards(filename, jobs):
+    """Split the file into at most `jobs` byte ranges aligned to lines."""
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as file:
+        for i in range(1, jobs):
+            file.seek(max(size * i // jobs, bounds[-1]))
+            if file.tell() > 0:
+                file.seek(file.tell() - 1)
+                file.readline()
+            bounds.append(max(file.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(start, end) for (start, end) in zip(bounds, bounds[1:])
+            if start < end]
+
+
+def read_shard(filename, start, end):
+    if start is None:
+        with open_log(filename) as file:
+            yield from file
+        return
+
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            yield line
+
+
+def parse_shard(args):
+    (filename, encoding, start, end, calls_dir) = args
+    logging.debug('Parse shard %s-%s of %s', start, end, filename)
+    (fd, calls_name) = tempfile.mkstemp(dir=calls_dir, suffix='.calls')
+    with os.fdopen(fd, 'wb') as file:
+        result = ShardParser(encoding, CallsFile(file)).parse(
+            read_shard(filename, start, end))
+    return (calls_name,) + result
+
+
+class ParallelLogParser(LogParser):
+    """
+    LogParser that decodes the log files in `jobs` worker processes.
+
+    Plain files are split into byte ranges, compressed files are
+    decompressed by one worker each. Workers turn their shard into the
+    model calls the serial parser would make, written to a temporary
+    file. The calls are replayed on the models shard by shard and batch
+    by batch, so the models end up exactly as after a serial run: submit
+    times resolved across shard boundaries and the insertion order of
+    every dict and set are preserved.
+    """
+
+    def __init__(self, log, course, answers, courses, *,
+                 jobs=None, encoding='utf8', stats=None, storage=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        super().__init__(log, course, answers, courses, encoding=encoding,
+                         stats=stats, storage=storage)
+
+    def _parse(self, log):
+        shards = []
+        for filename in [log] if isinstance(log, str) else log:
+            if iscompressed(filename):
+                shards.append((filename, None, None))
+            else:
+                shards += [(filename, start, end) for (start, end)
+                           in split_shards(filename, self.jobs)]
+        with tempfile.TemporaryDirectory(prefix='psychometrics-') as tmpdir:
+            shards = [(filename, self.encoding, start, end, tmpdir)
+                      for (filename, start, end) in shards]
+            with multiprocessing.Pool(self.jobs) as pool:
+                for result in pool.imap(parse_shard, shards):
+                    self._apply(*result)
+
+    def _apply(self, calls_name, course_name, parsed_lines, skipped_lines):
+        # the lines of the shards before, for the line numbers of the errors
+        first_line = self.parsed_lines + self.skipped_lines
+        self.course_name = course_name or self.course_name
+        self.parsed_lines += parsed_lines
+        self.skipped_lines += skipped_lines
+        if self.stats is not None:
+            # the handlers run in the workers, only the lines are counted
+            self.stats.lines += parsed_lines + skipped_lines
+        for (model, method, args) in read_calls(calls_name):
+            if model is None:
+                (line, error) = args
+                self._log_error(first_line + line, error)
+            else:
+                getattr(getattr(self, model), method)(*args)
+        os.remove(calls_name)
@@ -0,0 +1,223 @@
+import bz2
+import calendar
+import glob
+import gzip
+import hashlib
+import logging
+import lzma
+import os
+import queue
+import re
+import threading
+import time
+
+
+__all__ = ['find_logs', 'open_log', 'read_logs', 'LogReader']
+
+
+OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.lzma': lzma.open,
+}
+
+# tracking.log-20180301.gz, tracking.log-20180301-1519862401.gz
+ROTATED_RE = re.compile(r'-(\d{8})(?:-(\d{9,11}))?(?:\.\w+)?$')
+
+BATCH_SIZE = 10000
+# bytes of a log file identifying it, see get_log_key
+HEAD_SIZE = 4096
+PREFETCH_BATCHES = 8
+
+
+def iscompressed(filename):
+    return os.path.splitext(filename)[1] in OPENERS
+
+
+def open_log(filename):
+    """Open a plain or compressed log file for reading in binary mode."""
+    return OPENERS.get(os.path.splitext(filename)[1], open)(filename, 'rb')
+
+
+def get_log_time(filename):
+    """
+    Return the time the log file was last written to: the rotation time
+    from the file name, or the modification time for the current log.
+    """
+    match = ROTATED_RE.search(os.path.basename(filename))
+    if match:
+        (date, timestamp) = match.groups()
+        if timestamp:
+            return int(timestamp)
+        return calendar.timegm(time.strptime(date, '%Y%m%d'))
+    return os.path.getmtime(filename)
+
+
+def find_logs(paths):
+    """
+    Expand the files, directories and glob patterns into the list of
+    log files, oldest first.
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = [os.path.join(path, name) for name in os.listdir(path)]
+        else:
+            found = glob.glob(path)
+        found = [name for name in found if os.path.isfile(name)]
+        if not found:
+            raise FileNotFoundError('No log files found: {}'.format(path))
+        filenames += found
+
+    filenames = list(_unique(filenames))
+    return sorted(filenames, key=lambda name: (get_log_time(name), name))
+
+
+def _unique(items):
+    seen = set()
+    for item in items:
+        key = os.path.realpath(item)
+        if key not in seen:
+            seen.add(key)
+            yield item
+
+
+def read_head(filename):
+    """Return the first HEAD_SIZE bytes of the log file, decompressed."""
+    with open_log(filename) as file:
+        return file.read(HEAD_SIZE)
+
+
+def get_log_key(head):
+    """
+    Identify a log file by its first bytes: unlike the path or the inode,
+    they stay the same when the log is rotated, renamed or compressed.
+    """
+    return '{}:{}'.format(len(head), hashlib.sha1(head).hexdigest())
+
+
+def find_log_key(position, head, exclude=()):
+    """
+    Return the key of the file in `position` whose first bytes start
+    `head`, the longest first, or None. A file shorter than HEAD_SIZE
+    when it was read is matched by its bytes then, as it may have grown.
+    """
+    for size in sorted({entry['head'] for entry in position.values()},
+                       reverse=True):
+        if size <= len(head):
+            key = get_log_key(head[:size])
+            if key in position and key not in exclude:
+                return key
+    return None
+
+
+def _read_batches(filenames, position, batches, stop):
+    # Every batch goes with the position after its last line: for each log
+    # file, by its key, the byte offset reached once it is decompressed
+    position = dict(position)
+    seen = set()
+    try:
+        for filename in filenames:
+            head = read_head(filename)
+            if not head:
+                continue
+            key = find_log_key(position, head, seen)
+            if key is None:
+                key = get_log_key(head)
+                entry = {'head': len(head), 'offset': 0, 'complete': False}
+            else:
+                entry = position[key]
+            seen.add(key)
+            if entry['complete']:
+                logging.info('Skip log file %s read before', filename)
+                continue
+
+            offset = entry['offset']
+            logging.info('Read log file %s from %d', filename, offset)
+            with open_log(filename) as file:
+                file.seek(offset)
+                batch = []
+                for line in file:
+                    batch.append(line)
+                    offset += len(line)
+                    if len(batch) == BATCH_SIZE:
+                        position[key] = dict(
+                            entry, offset=offset, name=filename)
+                        if not _put(batches, (batch, dict(position)), stop):
+                            return
+                        batch = []
+                # a compressed log is no longer written to, a plain one may
+                # still grow and is read again from the offset reached
+                position[key] = dict(
+                    entry, offset=offset, name=filename,
+                    complete=iscompressed(filename))
+                if not _put(batches, (batch, dict(position)), stop):
+                    return
+        _put(batches, None, stop)
+    except Exception as e:
+        _put(batches, e, stop)
+
+
+def _put(batches, item, stop):
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class LogReader:
+    """
+    Iterates over the lines of the log files in order as bytes.
+
+    The files are read and decompressed in a background thread, which
+    overlaps with parsing since the decompressors release the GIL.
+
+    `position` is the position reached by the consumer: it is updated,
+    and passed to `on_batch`, once all the lines read before it have
+    been taken. It maps the key of every file read, see `get_log_key`,
+    to the decompressed byte offset reached in it.
+
+    Reading starts from the given `position`. The files are found there
+    by their first bytes, so a log rotated and compressed since keeps its
+    offset under its new name: the compressed logs read to the end are
+    skipped and the rest, such as the live log, are read from the offset
+    reached.
+    """
+
+    def __init__(self, filenames, position=None, on_batch=None):
+        self.filenames = list(filenames)
+        self.position = dict(position or {})
+        self.on_batch = on_batch
+
+    def __iter__(self):
+        batches = queue.Queue(PREFETCH_BATCHES)
+        stop = threading.Event()
+        reader = threading.Thread(
+            target=_read_batches,
+            args=(self.filenames, self.position, batches, stop),
+            daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                (batch, position) = item
+                yield from batch
+                self.position = position
+                if self.on_batch is not None:
+                    self.on_batch(position)
+        finally:
+            stop.set()
+            reader.join()
+
+
+def read_logs(filenames):
+    """Yield the lines of the log files in order as bytes."""
+    return iter(LogReader(filenames))
@@ -0,0 +1,132 @@
+import collections
+import contextlib
+import json
+import sys
+import time
+
+
+__all__ = ['RunStats']
+
+
+class HandlerStats:
+    __slots__ = ('calls', 'seconds', 'errors', 'error')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.error = None
+
+    def to_dict(self):
+        return {'calls': self.calls, 'seconds': round(self.seconds, 6),
+                'errors': self.errors, 'error': self.error}
+
+
+class RunStats:
+    """
+    Opt-in instrumentation of a converter run.
+
+    Records the calls, time and errors of every LogParser handler, the
+    time of the run stages (decoding, dispatch, `update_data`, every
+    output file) and samples of the line and byte throughput taken every
+    `sample_interval` seconds. With `progress_interval` the throughput
+    is also printed to `progress_file` as the log is parsed.
+
+    Bytes are the characters of the lines when the log is read as text.
+    """
+    CHECK_LINES = 4096
+
+    def __init__(self, *, sample_interval=10, progress_interval=None,
+                 progress_file=sys.stderr, clock=time.perf_counter):
+        self.sample_interval = sample_interval
+        self.progress_interval = progress_interval
+        self.progress_file = progress_file
+        self.clock = clock
+
+        self.handlers = collections.defaultdict(HandlerStats)
+        self.stages = collections.OrderedDict()
+        self.decode_errors = 0
+        self.decode_error = None
+        self.lines = 0
+        self.bytes = 0
+        self.samples = []
+
+        self._start = clock()
+        self._next_sample = self._start + sample_interval
+        self._next_progress = self._start + (progress_interval or 0)
+        self._check = self.CHECK_LINES
+
+    def add_time(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add_time(stage, self.clock() - start)
+
+    def add_call(self, name, seconds, error=None):
+        handler = self.handlers[name]
+        handler.calls += 1
+        handler.seconds += seconds
+        if error is not None:
+            handler.errors += 1
+            handler.error = handler.error or str(error)
+
+    def add_decode_error(self, error):
+        self.decode_errors += 1
+        self.decode_error = self.decode_error or str(error)
+
+    def add_line(self, size):
+        self.lines += 1
+        self.bytes += size
+        self._check -= 1
+        if not self._check:
+            self._check = self.CHECK_LINES
+            self.tick()
+
+    def tick(self, *, force=False):
+        """Take a throughput sample and print progress when they are due."""
+        now = self.clock()
+        if ((force or now >= self._next_sample) and
+                (not self.samples or self.samples[-1][1] != self.lines)):
+            self.samples.append((now - self._start, self.lines, self.bytes))
+            self._next_sample = now + self.sample_interval
+        if self.progress_interval and (force or now >= self._next_progress):
+            self._next_progress = now + self.progress_interval
+            self.print_progress(now - self._start)
+
+    def print_progress(self, seconds):
+        print('{:8.1f}s {:12,d} lines {:10,.0f} lines/s {:8.2f} MB/s'.format(
+            seconds, self.lines, self.lines / max(seconds, 1e-9),
+            self.bytes / 2 ** 20 / max(seconds, 1e-9)),
+            file=self.progress_file, flush=True)
+
+    def summary(self):
+        seconds = self.clock() - self._start
+        parse = self.stages.get('parse')
+        return {
+            'seconds': round(seconds, 3),
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'lines_per_second': round(self.lines / parse) if parse else None,
+            'mb_per_second': (round(self.bytes / 2 ** 20 / parse, 2)
+                              if parse else None),
+            'decode_errors': self.decode_errors,
+            'decode_error': self.decode_error,
+            'stages': {name: round(value, 6)
+                       for (name, value) in self.stages.items()},
+            'handlers': {
+                name: handler.to_dict() for (name, handler) in sorted(
+                    self.handlers.items(),
+                    key=lambda item: -item[1].seconds)},
+            'throughput': [
+                {'seconds': round(at, 3), 'lines': lines, 'bytes': size}
+                for (at, lines, size) in self.samples],
+        }
+
+    def dump(self, filename):
+        with open(filename, 'w', encoding='utf8') as file:
+            json.dump(self.summary(), file, indent=2)
@@ -0,0 +1,270 @@
+import array
+import collections
+import itertools
+import os
+import sqlite3
+import tempfile
+import weakref
+
+
+__all__ = ['MemoryStore', 'SqliteStore', 'STORES']
+
+
+class MemoryStore:
+    """
+    The users activity kept in memory, the default store.
+
+    Users, problems, subtasks and content are integer codes, times are
+    the encoded times of `models.Users`. The submits of every user are
+    packed into an `array` of `(subtask, time, correct)` triples with
+    the time of the last solution of the problem posted before them.
+    """
+    STRING_TIMES = False
+
+    def __init__(self):
+        self._times = {}
+        self._submits = {}
+        self._scored = set()
+        self._viewed = {}
+
+    def post_solution(self, user, problem, time):
+        self._times[user << 32 | problem] = time
+
+    def has_solution(self, user, problem):
+        """Whether a solution time replaces the time of the next submit."""
+        return user << 32 | problem in self._times
+
+    def score_task(self, user, problem, subtask, correct, time):
+        time = self._times.get(user << 32 | problem, time)
+        submits = self._submits.get(user)
+        if submits is None:
+            submits = self._submits[user] = array.array('q')
+        submits.extend((subtask, time, correct))
+        self._scored.add(user << 32 | subtask)
+
+    def view_content(self, user, content):
+        viewed = self._viewed.get(user)
+        if viewed is None:
+            viewed = self._viewed[user] = set()
+        viewed.add(content)
+
+    def get_submit_users(self):
+        return list(self._submits)
+
+    def get_submits(self, user):
+        """
+        Yield `(subtask, time, correct)` of the user submits grouped by
+        subtask, in the order of the first submits.
+        """
+        submits = self._submits.get(user, ())
+        subtasks = collections.OrderedDict()
+        for i in range(0, len(submits), 3):
+            subtasks.setdefault(submits[i], []).append(i)
+        for (subtask, indexes) in subtasks.items():
+            for i in indexes:
+                yield (subtask, submits[i + 1], submits[i + 2])
+
+    def iter_submits(self):
+        """Yield `(user, subtask, time, correct)` of all the users."""
+        for user in self._submits:
+            for submit in self.get_submits(user):
+                yield (user,) + submit
+
+    def has_submits(self, user, subtask):
+        return user << 32 | subtask in self._scored
+
+    def get_viewed_users(self):
+        return list(self._viewed)
+
+    def get_viewed_content(self, user):
+        return self._viewed.get(user, set())
+
+    def iter_viewed(self):
+        """Yield `(user, viewed content)` of all the users."""
+        return iter(self._viewed.items())
+
+    def close(self):
+        pass
+
+
+def _remove_database(db, filename):
+    db.close()
+    if os.path.exists(filename):
+        os.remove(filename)
+
+
+class SqliteStore:
+    """
+    The users activity kept in a scratch SQLite database, for the logs
+    whose activity does not fit in memory.
+
+    Rows are only appended while the log is parsed, `batch_size` at a
+    time, and the reads stream them back in the order of MemoryStore.
+    A submit gets its solution time when it is read: the time of the
+    last solution of the problem posted before it, by sequence number.
+    The time strings of another format are stored as they are rather
+    than interned, as nearly every such time is unique.
+    The database is a file in `directory`, removed on `close`; SQLite
+    keeps at most `cache_mb` of it in memory and sorts in temporary
+    files.
+    """
+    STRING_TIMES = True
+    BATCH_SIZE = 50000
+    FETCH_SIZE = 10000
+
+    SCHEMA = (
+        'CREATE TABLE solutions ('
+        'seq INTEGER PRIMARY KEY, user INTEGER, problem INTEGER, '
+        'time INTEGER)',
+        'CREATE TABLE submits ('
+        'seq INTEGER PRIMARY KEY, user INTEGER, problem INTEGER, '
+        'subtask INTEGER, time INTEGER, correct INTEGER)',
+        'CREATE TABLE viewed ('
+        'user INTEGER, content INTEGER, seq INTEGER, '
+        'PRIMARY KEY (user, content)) WITHOUT ROWID',
+    )
+    # built once the log is parsed, appending to unindexed tables is faster
+    INDEXES = (
+        'CREATE INDEX IF NOT EXISTS solutions_problem '
+        'ON solutions (user, problem, seq)',
+        'CREATE INDEX IF NOT EXISTS submits_subtask '
+        'ON submits (user, subtask, seq)',
+    )
+
+    SUBMIT_TIME = (
+        'COALESCE((SELECT p.time FROM solutions p '
+        'WHERE p.user = s.user AND p.problem = s.problem AND p.seq < s.seq '
+        'ORDER BY p.seq DESC LIMIT 1), s.time)')
+
+    def __init__(self, directory=None, *, batch_size=None, cache_mb=64):
+        (fd, self.filename) = tempfile.mkstemp(
+            dir=directory, prefix='psychometrics-', suffix='.sqlite')
+        os.close(fd)
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self._db = sqlite3.connect(self.filename)
+        self._finalizer = weakref.finalize(
+            self, _remove_database, self._db, self.filename)
+        for pragma in ('journal_mode = OFF', 'synchronous = OFF',
+                       'temp_store = FILE',
+                       'cache_size = {}'.format(-cache_mb * 1024)):
+            self._db.execute('PRAGMA ' + pragma)
+        for statement in self.SCHEMA:
+            self._db.execute(statement)
+
+        self._seq = 0
+        self._indexed = False
+        self._solutions = []
+        self._submits = []
+        self._viewed = {}
+
+    def __getstate__(self):
+        raise TypeError('The SQLite store cannot be saved to a checkpoint')
+
+    def _next_seq(self):
+        self._seq += 1
+        return self._seq
+
+    def post_solution(self, user, problem, time):
+        self._solutions.append((self._next_seq(), user, problem, time))
+        if len(self._solutions) >= self.batch_size:
+            self.flush()
+
+    def has_solution(self, user, problem):
+        # the solution times are looked up when the submits are read
+        return False
+
+    def score_task(self, user, problem, subtask, correct, time):
+        self._submits.append(
+            (self._next_seq(), user, problem, subtask, time, correct))
+        if len(self._submits) >= self.batch_size:
+            self.flush()
+
+    def view_content(self, user, content):
+        self._viewed.setdefault((user, content), self._next_seq())
+        if len(self._viewed) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._solutions:
+            self._db.executemany(
+                'INSERT INTO solutions VALUES (?, ?, ?, ?)', self._solutions)
+            self._solutions = []
+        if self._submits:
+            self._db.executemany(
+                'INSERT INTO submits VALUES (?, ?, ?, ?, ?, ?)',
+                self._submits)
+            self._submits = []
+        if self._viewed:
+            # the first view is kept, as the views of a batch are
+            # inserted after the views of the batches before
+            self._db.executemany(
+                'INSERT OR IGNORE INTO viewed VALUES (?, ?, ?)',
+                ((user, content, seq)
+                 for ((user, content), seq) in self._viewed.items()))
+            self._viewed = {}
+        self._db.commit()
+
+    def _query(self, sql, *params):
+        self.flush()
+        if not self._indexed:
+            for statement in self.INDEXES:
+                self._db.execute(statement)
+            self._indexed = True
+        cursor = self._db.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+    def get_submit_users(self):
+        return [user for (user,) in self._query(
+            'SELECT user FROM submits GROUP BY user ORDER BY MIN(seq)')]
+
+    def get_submits(self, user):
+        return self._query(
+            'SELECT s.subtask, {}, s.correct FROM submits s '
+            'JOIN (SELECT subtask, MIN(seq) AS first FROM submits '
+            'WHERE user = ? GROUP BY subtask) f ON f.subtask = s.subtask '
+            'WHERE s.user = ? ORDER BY f.first, s.seq'.format(
+                self.SUBMIT_TIME), user, user)
+
+    def iter_submits(self):
+        return self._query(
+            'SELECT s.user, s.subtask, {}, s.correct FROM submits s '
+            'JOIN (SELECT user, MIN(seq) AS first FROM submits '
+            'GROUP BY user) u ON u.user = s.user '
+            'JOIN (SELECT user, subtask, MIN(seq) AS first FROM submits '
+            'GROUP BY user, subtask) f '
+            'ON f.user = s.user AND f.subtask = s.subtask '
+            'ORDER BY u.first, f.first, s.seq'.format(self.SUBMIT_TIME))
+
+    def has_submits(self, user, subtask):
+        return any(self._query(
+            'SELECT 1 FROM submits WHERE user = ? AND subtask = ? LIMIT 1',
+            user, subtask))
+
+    def get_viewed_users(self):
+        return [user for (user,) in self._query(
+            'SELECT user FROM viewed GROUP BY user ORDER BY MIN(seq)')]
+
+    def get_viewed_content(self, user):
+        return {content for (content,) in self._query(
+            'SELECT content FROM viewed WHERE user = ?', user)}
+
+    def iter_viewed(self):
+        rows = self._query(
+            'SELECT v.user, v.content FROM viewed v '
+            'JOIN (SELECT user, MIN(seq) AS first FROM viewed '
+            'GROUP BY user) u ON u.user = v.user ORDER BY u.first, v.user')
+        for (user, group) in itertools.groupby(rows, key=lambda row: row[0]):
+            yield (user, {content for (_, content) in group})
+
+    def close(self):
+        self._finalizer()
+
+
+STORES = {
+    'memory': MemoryStore,
+    'sqlite': SqliteStore,
+}
@@ -0,0 +1,139 @@
+import collections
+import functools
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .utils import FakeAnswers, FakeCourse
+from . import parser_test
+from checkpoint import Checkpoint
+from csv5 import process_all_csvs
+from logs import LogParser, MultiCourseLogParser
+from sources import LogReader
+
+
+class CheckpointTest(unittest.TestCase):
+    LOG = parser_test.LogsTest.LOG
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.logs = [self.path('tracking.log-20180301'),
+                     self.path('tracking.log-20180302.gz')]
+        self.write(self.logs[0], self.LOG[:5])
+        self.write(self.logs[1], self.LOG[5:], gzip.open)
+        self.checkpoint = Checkpoint(self.path('checkpoint'), interval=0)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def write(self, filename, lines, opener=open):
+        with opener(filename, 'wb') as file:
+            file.write(''.join(line + '\n' for line in lines).encode('utf8'))
+
+    def sources(self):
+        return (FakeCourse(
+            modules=collections.OrderedDict([
+                ('m1', 'module 1'), ('m2', 'module 2')]),
+            content={}), FakeAnswers([]), collections.defaultdict(str))
+
+    def parse(self, logs, parser_class=LogParser, resume=False):
+        (state, position) = (
+            self.checkpoint.load() if resume else (None, None))
+        return parser_class(
+            LogReader(logs, position), *self.sources(), encoding='utf8',
+            state=state, checkpoint=self.checkpoint)
+
+    def output(self, parser):
+        outdir = tempfile.mkdtemp(dir=self.dir.name)
+        process_all_csvs(os.path.join(outdir, 'csv'), 'utf8', parser)
+        result = {}
+        for filename in sorted(os.listdir(outdir)):
+            with open(os.path.join(outdir, filename), 'rb') as file:
+                result[filename] = file.read()
+        return result
+
+    def test_resume_after_error(self):
+        expected = self.output(self.parse(self.logs))
+        os.remove(self.checkpoint.filename)
+
+        with open(self.logs[1], 'rb') as file:
+            data = file.read()
+        with open(self.logs[1], 'wb') as file:
+            file.write(data[:len(data) // 2])
+        with mock.patch('sources.BATCH_SIZE', 2):
+            with self.assertRaises(EOFError):
+                self.parse(self.logs)
+        (state, position) = self.checkpoint.load()
+        self.assertEqual(state['parsed_lines'], 5)
+        self.assertListEqual(
+            [(entry['name'], entry['offset'], entry['complete'])
+             for entry in position.values()],
+            [(self.logs[0], os.path.getsize(self.logs[0]), False)])
+
+        self.write(self.logs[1], self.LOG[5:], gzip.open)
+        parser = self.parse(self.logs, resume=True)
+        self.assertEqual(parser.parsed_lines, len(self.LOG))
+        self.assertDictEqual(self.output(parser), expected)
+
+    def test_resume_from_offset(self):
+        logs = [self.path('tracking.log.gz')]
+        # stored uncompressed, so that half the file holds more than the
+        # first bytes identifying it
+        opener = functools.partial(gzip.open, compresslevel=0)
+        self.write(logs[0], self.LOG * 20, opener)
+        expected = self.output(self.parse(logs))
+        os.remove(self.checkpoint.filename)
+
+        with open(logs[0], 'rb') as file:
+            data = file.read()
+        with open(logs[0], 'wb') as file:
+            file.write(data[:len(data) // 2])
+        with mock.patch('sources.BATCH_SIZE', 2):
+            with self.assertRaises(EOFError):
+                self.parse(logs)
+        (state, position) = self.checkpoint.load()
+        [entry] = position.values()
+        self.assertGreater(entry['offset'], 0)
+        self.assertFalse(entry['complete'])
+
+        self.write(logs[0], self.LOG * 20, opener)
+        parser = self.parse(logs, resume=True)
+        self.assertEqual(parser.parsed_lines, len(self.LOG) * 20)
+        self.assertDictEqual(self.output(parser), expected)
+
+    def test_append_log(self):
+        expected = self.output(self.parse(self.logs))
+
+        self.parse(self.logs[:1])
+        parser = self.parse(self.logs, resume=True)
+        self.assertEqual(parser.parsed_lines, len(self.LOG))
+        self.assertDictEqual(self.output(parser), expected)
+
+    def test_rotated_log(self):
+        log = self.path('tracking.log')
+        expected = self.output(self.parse(self.logs))
+
+        # the live log is read, then grows and is rotated and compressed
+        self.write(log, self.LOG[:3])
+        self.parse([log])
+        self.write(log, self.LOG[:5])
+        os.remove(log)
+        self.write(self.logs[0] + '.gz', self.LOG[:5], gzip.open)
+        self.write(log, self.LOG[5:])
+        parser = self.parse([self.logs[0] + '.gz', log], resume=True)
+        self.assertEqual(parser.parsed_lines, len(self.LOG))
+        self.assertDictEqual(self.output(parser), expected)
+
+        parser = self.parse([self.logs[0] + '.gz', log], resume=True)
+        self.assertEqual(parser.parsed_lines, len(self.LOG))
+
+    def test_multi_course(self):
+        parser = self.parse(self.logs[:1], MultiCourseLogParser)
+        self.assertIn('parsers', self.checkpoint.load()[0])
+        parser = self.parse(self.logs, MultiCourseLogParser, resume=True)
+        self.assertEqual(parser.parsed_lines, len(self.LOG))
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+import columnar as t
+import csv5
+
+
+@unittest.skipIf(t.pyarrow is None, 'pyarrow is not installed')
+class ParquetWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.dir.name, 'csv')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_csv1(self):
+        with csv5.CSV1(self.prefix, 'utf8', output_format='parquet') as p:
+            p.writeiter([
+                ('15', 't1', 0, '02.01.2018 09:30:00'),
+                ('15', 't1', 1, '02.01.2018 10:00:00'),
+                ('', 't1', 1, '02.01.2018 10:00:00'),
+                ('16', 't2', 1, '2018-01-02T10:30:00.123+00:00'),
+                ('16', 't2', 1, 't'),
+                ('None', 't2', 0, '02.01.2018 11:00:00'),
+            ])
+
+        table = t.pyarrow.parquet.read_table(self.prefix + '1.parquet')
+        self.assertListEqual(
+            [str(field.type) for field in table.schema],
+            ['int64', 'string', 'uint8', 'int64'])
+        self.assertDictEqual(table.to_pydict(), {
+            'user_id': [15, 15, 16, 16, None],
+            'item_id': ['t1', 't1', 't2', 't2', 't2'],
+            'correct': [0, 1, 1, 1, 0],
+            'time': [1514885400, 1514887200, 1514889000, None, 1514890800],
+        })
+
+    def test_row_groups(self):
+        writer = t.ParquetWriter(
+            self.prefix + '5.parquet',
+            ['user_id', 'item_id', 'reviewer_id', 'score', 'max_score'])
+        writer.ROW_GROUP_SIZE = 2
+        writer.writerows([('1', 'i1', '3', '1', '2')] * 3)
+        writer.writerows([('2', 'i1', '3', '0', '2')])
+        writer.close()
+
+        parquet = t.pyarrow.parquet.ParquetFile(self.prefix + '5.parquet')
+        self.assertEqual(parquet.metadata.num_row_groups, 2)
+        table = parquet.read()
+        self.assertListEqual(
+            table.column('user_id').to_pylist(), [1] * 3 + [2])
+        self.assertListEqual(table.column('reviewer_id').to_pylist(), [3] * 4)
+        self.assertListEqual(table.column('score').to_pylist(), [1, 1, 1, 0])
+        self.assertEqual(str(table.schema.field('score').type), 'int64')
+
+    def test_empty(self):
+        with csv5.CSV3(self.prefix, 'utf8', output_format='parquet'):
+            pass
+        table = t.pyarrow.parquet.read_table(self.prefix + '3.parquet')
+        self.assertEqual(table.num_rows, 0)
+        self.assertListEqual(
+            table.schema.names, ['user_id', 'content_piece_id', 'viewed'])
@@ -29,3 +29,16 @@ type@chapter+block@m4;type@sequential+block@s4;type@vertical+block@V1;type@probl
                 'type@video+block@v1': 'm1',
                 'type@video+block@v2': 'm1'
             })
+
+    def test_for_course(self):
+        courses = t.CourseParser([
+            'block-v1:a+b+c+type@chapter+block@m1;'
+            'block-v1:a+b+c+type@video+block@v1;Module 1',
+            'block-v1:d+e+f+type@chapter+block@m2;'
+            'block-v1:d+e+f+type@video+block@v2;Module 2',
+            'type@chapter+block@m3;type@video+block@v3;Module 3',
+        ]).for_course('a+b+c')
+        self.assertDictEqual(courses.content, {
+            'block-v1:a+b+c+type@video+block@v1': 'm1',
+            'type@video+block@v3': 'm3'})
+        self.assertListEqual(list(courses.modules), ['m1', 'm2', 'm3'])
@@ -0,0 +1,62 @@
+import itertools
+import os
+import tempfile
+import unittest
+
+import csv5 as t
+
+
+class ValidatorTest(unittest.TestCase):
+    VALUES = ['', 'None', 'a', '0', '1', '2', '-1', '+3', ' 4', '1_0',
+              '٣', '²', '0.5', '00']
+
+    def test_same_as_checkers(self):
+        checkers = [
+            t.Checkers.nonempty, t.Checkers.non_empty_or_none,
+            t.Checkers.zero_or_one, t.Checkers.positive_int,
+            t.Checkers.nonnegative_int, lambda value: value == 'a']
+        for checker in checkers:
+            validate = t.compile_validator((('x', checker),))
+            for value in self.VALUES:
+                self.assertEqual(
+                    validate((value,)) is None, bool(checker(value)),
+                    (checker, value))
+
+    def test_first_invalid(self):
+        validate = t.compile_validator(tuple(t.CSV5.COLUMNS))
+        for row in itertools.product(['', 'u'], ['-1', '1'], ['0', '5']):
+            (user_id, score, max_score) = row
+            expected = next((i for (i, valid) in enumerate([
+                user_id, True, True, score != '-1', max_score != '0'])
+                if not valid), None)
+            self.assertEqual(
+                validate((user_id, 'i', 'r', score, max_score)), expected)
+
+
+class CSVProcessorTest(unittest.TestCase):
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            prefix = os.path.join(dirname, 'csv')
+            with t.CSV5(prefix, 'utf8') as processor:
+                processor.BATCH_SIZE = 2
+                processor.writeiter([
+                    ('u1', 'i1', 'r1', 1, 2),
+                    ('u2', 'i1', 'r1', -1, 2),
+                    ('', 'i1', 'r1', 1, 2),
+                    ('u3', 'i1', 'r1', 0, 2),
+                    ('u4', 'i1', 'r1', 2, 0),
+                    ('u5', 'i1', 'r1', 'x', 2),
+                    ('u6', 'i1', 'r1', 2, 3),
+                ])
+                self.assertDictEqual(dict(processor.invalid), {
+                    ('score', 'nonnegative_int'): 2,
+                    ('user_id', 'nonempty'): 1,
+                    ('max_score', 'positive_int'): 1})
+                self.assertListEqual(
+                    processor.samples[('score', 'nonnegative_int')],
+                    [('u2', 'i1', 'r1', '-1', '2'),
+                     ('u5', 'i1', 'r1', 'x', '2')])
+            with open(prefix + '5.csv', encoding='utf8') as file:
+                self.assertListEqual(file.read().splitlines(), [
+                    'user_id;item_id;reviewer_id;score;max_score',
+                    'u1;i1;r1;1;2', 'u3;i1;r1;0;2', 'u6;i1;r1;2;3'])
@@ -0,0 +1,43 @@
+import io
+import unittest
+
+from answers import AnswersParser
+from course import CourseParser, CoursesParser
+from logs import LogParser
+
+from benchmarks.generate import LogGenerator
+
+
+class LogGeneratorTest(unittest.TestCase):
+    PARAMS = {'learners': 10, 'problems': 4, 'videos': 3, 'ora': 2}
+
+    def generate(self, **params):
+        log = io.StringIO()
+        LogGenerator(**dict(self.PARAMS, **params)).write(log)
+        return log.getvalue().splitlines(keepends=True)
+
+    def test_reproducible(self):
+        self.assertListEqual(self.generate(), self.generate())
+        self.assertNotEqual(self.generate(), self.generate(seed=1))
+
+    def test_parse(self):
+        lines = self.generate()
+        parser = LogParser(lines, CourseParser([]), AnswersParser([]),
+                           CoursesParser([]))
+
+        self.assertEqual(parser.course_name, 'bench+BN101+2018')
+        self.assertEqual(parser.parsed_lines + parser.skipped_lines,
+                         len(lines))
+        self.assertGreater(parser.skipped_lines, parser.parsed_lines)
+        self.assertTrue(list(parser.get_student_solutions()))
+        # problems have one to three subtasks each, assessments one
+        self.assertGreaterEqual(len(list(parser.get_tasks())), 4 + 2)
+        self.assertEqual(len(list(parser.get_content())), 3)
+        self.assertTrue(list(parser.get_assessments()))
+
+    def test_no_noise(self):
+        lines = self.generate(noise=0)
+        parser = LogParser(lines, CourseParser([]), AnswersParser([]),
+                           CoursesParser([]))
+
+        self.assertEqual(parser.skipped_lines, 0)
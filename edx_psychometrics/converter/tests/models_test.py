@@ -1,8 +1,11 @@
+import os
+import tempfile
 import unittest
 from collections import OrderedDict
 
 from .utils import FakeAnswers, FakeCourse
 import models as t
+from storage import SqliteStore
 
 
 class NormalizersTest(unittest.TestCase):
@@ -45,6 +48,35 @@ class UsersTest(unittest.TestCase):
             }
         })
 
+    def test_times(self):
+        times = ['01.01.2018 12:00:00', '29.02.2016 23:59:59', None, 't1',
+                 '31.02.2018 12:00:00', '01.01.2018 12:00:60']
+        for (i, time) in enumerate(times):
+            self.users.post_solution('u1', 'p{}'.format(i), time)
+            self.users.score_task('u1', 'p{}'.format(i), 's', i % 2)
+        self.users.score_task('u2', 'p0', 's', True, '01.01.2018 12:00:00')
+
+        self.assertListEqual(
+            list(self.users.get_submits('u1')),
+            [('s', time, i % 2) for (i, time) in enumerate(times)])
+        self.assertListEqual(
+            list(self.users.get_submits('u2')),
+            [('s', '01.01.2018 12:00:00', 1)])
+        self.assertListEqual(list(self.users.get_submits('u3')), [])
+        self.assertTrue(self.users.has_submits('u2', 's'))
+        self.assertFalse(self.users.has_submits('u2', 'p0'))
+        self.assertFalse(self.users.has_submits('u3', 's'))
+
+    def test_replaced_time(self):
+        self.users.post_solution('u1', 'p1', '01.01.2018 12:00:00')
+        self.users.score_task('u1', 'p1', 's', 1, '2018-01-01T12:00:00+00:00')
+        self.users.score_task('u1', 'p2', 's', 0, '2018-01-01T12:10:00+00:00')
+
+        self.assertListEqual(list(self.users.get_submits('u1')), [
+            ('s', '01.01.2018 12:00:00', 1),
+            ('s', '2018-01-01T12:10:00+00:00', 0)])
+        self.assertNotIn('2018-01-01T12:00:00+00:00', self.users._codes)
+
     def test_assessments(self):
         self.users.create_submission('s1', '100', 'p1')
         self.users.assess('s1', '123', '1', '12')
@@ -88,6 +120,19 @@ class UsersTest(unittest.TestCase):
         })
 
 
+class SqliteUsersTest(UsersTest):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        # small batches, so that the rows are spread over several inserts
+        self.store = SqliteStore(self.dir.name, batch_size=2)
+        self.users = t.Users(self.store)
+
+    def tearDown(self):
+        self.users.close()
+        self.assertListEqual(os.listdir(self.dir.name), [])
+        self.dir.cleanup()
+
+
 class TasksTest(unittest.TestCase):
     def setUp(self):
         self.tasks = t.Tasks()
@@ -0,0 +1,96 @@
+import collections
+import gzip
+import os
+import tempfile
+import unittest
+
+from .utils import FakeAnswers, FakeCourse
+from . import parser_test
+from csv5 import process_all_csvs
+from logs import LogParser
+from sources import read_logs
+import parallel as t
+
+
+class ParallelLogParserTest(unittest.TestCase):
+    LOG = (parser_test.LogsTest.LOG + [
+        '9:{"event_type": "page_close", "event": "{}"}']) * 3
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.logname = os.path.join(self.dir.name, 'log')
+        with open(self.logname, 'w', encoding='utf8') as file:
+            file.write('\n'.join(self.LOG) + '\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def sources(self):
+        return (FakeCourse(
+            modules=collections.OrderedDict([
+                ('m1', 'module 1'), ('m2', 'module 2')]),
+            content={}), FakeAnswers([]), collections.defaultdict(str))
+
+    def output(self, parser, name):
+        outdir = os.path.join(self.dir.name, name)
+        os.mkdir(outdir)
+        process_all_csvs(os.path.join(outdir, 'csv'), 'utf8', parser)
+        result = {}
+        for filename in sorted(os.listdir(outdir)):
+            with open(os.path.join(outdir, filename), 'rb') as file:
+                result[filename] = file.read()
+        return result
+
+    def test_split_shards(self):
+        size = os.path.getsize(self.logname)
+        for jobs in (1, 2, 5, 100):
+            shards = t.split_shards(self.logname, jobs)
+            self.assertEqual(shards[0][0], 0)
+            self.assertEqual(shards[-1][1], size)
+            for ((_, end), (start, _)) in zip(shards, shards[1:]):
+                self.assertEqual(end, start)
+            lines = []
+            for (start, end) in shards:
+                lines += list(t.read_shard(self.logname, start, end))
+            self.assertListEqual(
+                [line.decode('utf8').rstrip('\n') for line in lines],
+                self.LOG)
+
+    def test_same_as_serial(self):
+        with open(self.logname, encoding='utf8') as logfile:
+            serial = LogParser(logfile, *self.sources())
+        expected = self.output(serial, 'serial')
+
+        for jobs in (2, 4, 7):
+            parser = t.ParallelLogParser(
+                self.logname, *self.sources(), jobs=jobs)
+            self.assertDictEqual(
+                self.output(parser, 'jobs{}'.format(jobs)), expected)
+            self.assertEqual(
+                (parser.parsed_lines, parser.skipped_lines),
+                (serial.parsed_lines, serial.skipped_lines))
+
+    def test_error_lines(self):
+        with open(self.logname, 'a', encoding='utf8') as file:
+            file.write('10:{"event_type": "play_video", "event": "{"}\n')
+        with self.assertLogs(level='WARNING') as serial:
+            with open(self.logname, encoding='utf8') as logfile:
+                LogParser(logfile, *self.sources())
+        with self.assertLogs(level='WARNING') as parallel:
+            t.ParallelLogParser(self.logname, *self.sources(), jobs=4)
+        self.assertIn('line {}:'.format(len(self.LOG)), serial.output[-1])
+        self.assertListEqual(parallel.output, serial.output)
+
+    def test_compressed(self):
+        gzname = self.logname + '-20180301.gz'
+        with open(self.logname, 'rb') as file, gzip.open(gzname, 'wb') as gz:
+            gz.write(file.read())
+        logs = [gzname, self.logname]
+
+        serial = LogParser(
+            read_logs(logs), *self.sources(), encoding='utf8')
+        expected = self.output(serial, 'serial')
+
+        parser = t.ParallelLogParser(logs, *self.sources(), jobs=3)
+        self.assertEqual(parser.parsed_lines, serial.parsed_lines)
+        self.assertDictEqual(self.output(parser, 'compressed'), expected)
@@ -1,8 +1,9 @@
 import collections
+import json
 import unittest
 
 from .utils import FakeAnswers, FakeCourse
-from logs import LogParser
+from logs import LogParser, MultiCourseLogParser
 
 
 class LogsTest(unittest.TestCase):
@@ -40,3 +41,66 @@ class LogsTest(unittest.TestCase):
         self.assertSetEqual(
             set(report.get_assessments()),
             {('uu', 'bb', 'u2', 3, 5)})
+
+    def test_line_filter(self):
+        noise = [
+            '9:{"event_type": "page_close", "event": "{}"}',
+            '10:{"event_type": "/courses/a/courseware/", "event_source": "server"}',
+            '11:{"event_type": "problem_check_fail", "event": {}}',
+        ]
+        report = LogParser(noise + self.LOG, FakeCourse(), FakeAnswers([]),
+                           collections.defaultdict(str))
+        self.assertEqual(report.parsed_lines, len(self.LOG))
+        self.assertEqual(report.skipped_lines, len(noise))
+
+        match = LogParser.get_line_filter(binary=True)
+        self.assertIsNotNone(match(self.LOG[0].encode('utf8')))
+        self.assertIsNone(match(noise[0].encode('utf8')))
+
+    def test_multi_course(self):
+        courses = ['course-v1:a+b+c', 'course-v1:d+e+f']
+        log = [self.LOG[0]]
+        for (i, line) in enumerate(self.LOG):
+            (number, item) = line.split(':', 1)
+            item = json.loads(item)
+            item.setdefault('context', {})['course_id'] = courses[i % 2]
+            log.append('{}:{}'.format(number, json.dumps(item)))
+        sources = (FakeCourse(), FakeAnswers([]), collections.defaultdict(str))
+
+        report = MultiCourseLogParser(log, *sources)
+        self.assertListEqual(list(report.parsers), ['a+b+c', 'd+e+f'])
+        for (i, (name, parser)) in enumerate(report.parsers.items()):
+            single = LogParser(log[i + 1::2], *sources)
+            self.assertEqual(parser.get_course_info()['short_name'], name)
+            self.assertEqual(single.get_course_info()['short_name'], name)
+            for method in ('get_student_solutions', 'get_assessments'):
+                self.assertListEqual(
+                    list(map(list, getattr(parser, method)())),
+                    list(map(list, getattr(single, method)())))
+            self.assertEqual(dict(parser.users.viewed_content),
+                             dict(single.users.viewed_content))
+
+        report = MultiCourseLogParser(log, *sources, course_names=['d+e+f'])
+        self.assertListEqual(list(report.parsers), ['d+e+f'])
+
+    def test_student_content(self):
+        log = self.LOG + [
+            '9:{"event_type": "load_video", "event": "{\\"id\\": \\"v2\\"}", "page": "https://pages.local/m2/0/"}',
+            '10:{"event_type": "load_video", "event": "{\\"id\\": \\"v3\\"}", "page": "https://pages.local/m3/0/"}',
+            '11:{"event_type": "play_video", "event": "{\\"id\\": \\"v2\\"}", "context": {"user_id": "u2"}}',
+            '12:{"event_type": "play_video", "event": "{\\"id\\": \\"v1\\"}", "context": {"user_id": "u2"}}',
+            '13:{"event_type": "play_video", "event": "{\\"id\\": \\"v3\\"}", "context": {"user_id": "u2"}}',
+        ]
+        report = LogParser(log, FakeCourse(
+            modules=collections.OrderedDict([
+                ('m1', 'module 1'), ('m2', 'module 2')]),
+            content={}), FakeAnswers([]), collections.defaultdict(str))
+
+        self.assertListEqual(sorted(report.get_module_content()), ['v1', 'v2'])
+        dense = list(report.get_student_content())
+        sparse = list(report.get_student_content(sparse=True))
+        self.assertListEqual(sparse, [row for row in dense if row[2]])
+        self.assertListEqual(
+            sorted(dense),
+            [('u2', 'v1', 1), ('u2', 'v2', 1), ('uu', 'v1', 1),
+             ('uu', 'v2', 0)])
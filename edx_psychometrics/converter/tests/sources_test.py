@@ -0,0 +1,69 @@
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import unittest
+
+import sources as t
+
+
+class SourcesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, lines, opener=open):
+        filename = os.path.join(self.dir.name, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with opener(filename, 'wb') as file:
+            file.write(b''.join(line + b'\n' for line in lines))
+        return filename
+
+    def test_find_logs(self):
+        current = self.write('logs/tracking.log', [b'4'])
+        old = self.write('logs/tracking.log-20180302.gz', [b'2'], gzip.open)
+        older = self.write(
+            'logs/tracking.log-20180301-1519862401.bz2', [b'1'], bz2.open)
+        new = self.write('logs/tracking.log-20180303.xz', [b'3'], lzma.open)
+        os.utime(current, (1600000000, 1600000000))
+
+        self.assertListEqual(
+            t.find_logs([os.path.join(self.dir.name, 'logs')]),
+            [older, old, new, current])
+        self.assertListEqual(
+            t.find_logs([os.path.join(self.dir.name, 'logs', '*.?z'),
+                         current, old]),
+            [old, new, current])
+        with self.assertRaises(FileNotFoundError):
+            t.find_logs([os.path.join(self.dir.name, 'logs', '*.log-2017*')])
+
+    def test_read_logs(self):
+        filenames = [
+            self.write('a.log-20180301.gz', [b'a', b'b'], gzip.open),
+            self.write('b.log-20180302.bz2', [b'c'], bz2.open),
+            self.write('c.log-20180303.xz', [], lzma.open),
+            self.write('d.log', [b'd', b'e']),
+        ]
+        self.assertListEqual(
+            list(t.read_logs(filenames)),
+            [b'a\n', b'b\n', b'c\n', b'd\n', b'e\n'])
+
+    def test_read_logs_batches(self):
+        lines = [str(i).encode() for i in range(t.BATCH_SIZE * 3 + 1)]
+        filename = self.write('log.gz', lines, gzip.open)
+        self.assertEqual(
+            list(t.read_logs([filename])), [line + b'\n' for line in lines])
+
+        logs = t.read_logs([filename] * 20)
+        self.assertEqual(next(logs), b'0\n')
+        logs.close()
+
+    def test_read_logs_error(self):
+        filename = os.path.join(self.dir.name, 'log.gz')
+        with open(filename, 'wb') as file:
+            file.write(b'not gzip')
+        with self.assertRaises(OSError):
+            list(t.read_logs([filename]))
@@ -0,0 +1,65 @@
+import collections
+import io
+import itertools
+import unittest
+
+from .parser_test import LogsTest
+from .utils import FakeAnswers, FakeCourse
+from logs import LogParser, MultiCourseLogParser
+from stats import RunStats
+
+
+class RunStatsTest(unittest.TestCase):
+    def sources(self):
+        return (FakeCourse(), FakeAnswers([]), collections.defaultdict(str))
+
+    def test_handlers(self):
+        log = LogsTest.LOG + [
+            '9:{"event_type": "play_video", "event": "{broken"}',
+            '10:{"event_type": "load_video"',
+            '11:{"event_type": "page_close", "event": "{}"}',
+        ]
+        stats = RunStats()
+        parser = LogParser(log, *self.sources(), stats=stats)
+        plain = LogParser(log, *self.sources())
+        summary = stats.summary()
+
+        self.assertEqual(summary['lines'], len(log))
+        self.assertEqual(summary['bytes'], sum(map(len, log)))
+        self.assertEqual(summary['decode_errors'], 1)
+        handlers = summary['handlers']
+        self.assertEqual(handlers['_play_video']['calls'], 2)
+        self.assertEqual(handlers['_play_video']['errors'], 1)
+        self.assertIsNotNone(handlers['_play_video']['error'])
+        self.assertEqual(handlers['_problem_check_server']['calls'], 2)
+        self.assertEqual(handlers['_problem_submitted']['errors'], 0)
+        self.assertTrue({'parse', 'decode', 'dispatch', 'update_data'}
+                        <= set(summary['stages']))
+        self.assertListEqual(list(parser.get_student_solutions()),
+                             list(plain.get_student_solutions()))
+
+    def test_multi_course(self):
+        log = [line.replace('"context": {', '"context": {"course_id": "a:b", ')
+               for line in LogsTest.LOG]
+        stats = RunStats()
+        parser = MultiCourseLogParser(log, *self.sources(), stats=stats)
+
+        self.assertListEqual(list(parser.parsers), ['b'])
+        # the events with no context have no course and are skipped
+        self.assertNotIn('_load_video', stats.handlers)
+        self.assertEqual(stats.handlers['_play_video'].calls, 1)
+
+    def test_throughput(self):
+        clock = itertools.count(step=50).__next__
+        progress = io.StringIO()
+        stats = type('Stats', (RunStats,), {'CHECK_LINES': 10})(
+            sample_interval=100, progress_interval=1000,
+            progress_file=progress, clock=clock)
+        for _ in range(100):
+            stats.add_line(5)
+        stats.tick(force=True)
+
+        self.assertListEqual(
+            [(lines, size) for (_, lines, size) in stats.samples],
+            [(20, 100), (40, 200), (60, 300), (80, 400), (100, 500)])
+        self.assertEqual(len(progress.getvalue().splitlines()), 1)
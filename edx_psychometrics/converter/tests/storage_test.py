@@ -0,0 +1,48 @@
+import collections
+import functools
+import io
+import os
+import tempfile
+import unittest
+
+from .utils import FakeAnswers, FakeCourse
+from benchmarks.generate import LogGenerator
+from logs import LogParser
+from storage import SqliteStore
+
+
+class SqliteStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        log = io.StringIO()
+        LogGenerator(learners=20, problems=6, videos=5, ora=1).write(log)
+        self.log = log.getvalue().splitlines()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def parse(self, storage=None):
+        return LogParser(
+            self.log, FakeCourse(), FakeAnswers([]),
+            collections.defaultdict(str), storage=storage)
+
+    def test_same_as_memory(self):
+        memory = self.parse()
+        sqlite = self.parse(functools.partial(
+            SqliteStore, self.dir.name, batch_size=7))
+
+        for method in ('get_student_solutions', 'get_student_content',
+                       'get_assessments'):
+            self.assertListEqual(
+                list(getattr(sqlite, method)()),
+                list(getattr(memory, method)()))
+        self.assertListEqual(
+            list(sqlite.get_student_content(sparse=True)),
+            list(memory.get_student_content(sparse=True)))
+        self.assertListEqual(
+            list(sqlite.get_student_solutions('3')),
+            list(memory.get_student_solutions('3')))
+
+        self.assertEqual(len(os.listdir(self.dir.name)), 1)
+        sqlite.close()
+        self.assertListEqual(os.listdir(self.dir.name), [])
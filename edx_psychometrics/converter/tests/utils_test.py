@@ -41,11 +41,34 @@ class UtilsFunctionsTest(unittest.TestCase):
         self.assertEqual(t.get_items(
             self.DATA, ['aa', 'dd.aa', 'dd.bb.cc.ee.ff']), ['1', '2', '4'])
 
+    def test_in_course(self):
+        self.assertTrue(t.in_course('block-v1:a+b+c+type@video+block@v', 'a+b+c'))
+        self.assertFalse(t.in_course('block-v1:a+b+d+type@video+block@v', 'a+b+c'))
+        self.assertTrue(t.in_course('type@video+block@v', 'a+b+c'))
+        self.assertTrue(t.in_course('v', 'a+b+c'))
+
+    def test_get_course_dirnames(self):
+        self.assertDictEqual(
+            dict(t.get_course_dirnames(['a+b+c', 'a/b/c', 'a/b', 'a+b'])),
+            {'a+b+c': 'a+b+c', 'a/b/c': 'a+b+c-2', 'a/b': 'a+b',
+             'a+b': 'a+b-2'})
+
     def test_convert_datetime(self):
         self.assertEqual(t.convert_datetime('2018-03-03T16:00:14.5678'),
                          '03.03.2018 16:00:14')
         self.assertEqual(t.convert_datetime('2018-03-17T01:59:14.5678+0000'),
                          '17.03.2018 01:59:14')
+        self.assertEqual(t.convert_datetime('2018-12-31T23:59:14+00:00'),
+                         '31.12.2018 23:59:14')
+        self.assertEqual(t.convert_datetime('2016-02-29T00:00:00'),
+                         '29.02.2016 00:00:00')
+        self.assertEqual(t.convert_datetime('2018-3-7T1:59:14.1'),
+                         '07.03.2018 01:59:14')
+        for timestr in ('2018-02-29T00:00:00', '2018-13-01T00:00:00',
+                        '2018-03-17 01:59:14', '2018-03-17T24:00:00',
+                        '2018-03-17T01:59:60', '2018-03-17T01:59:61', ''):
+            with self.assertRaises(ValueError):
+                t.convert_datetime(timestr)
 
 
 class NonEmptyDictTests(unittest.TestCase):
@@ -85,6 +108,7 @@ class RegistryTests(unittest.TestCase):
         return 3
 
     def test_registry(self):
+        self.assertEqual(self.registry.get_keys(), ('x', {'a', 'b', 'c', 'd'}))
         self.assertEqual(self.registry(self, {'x': 'a'}), 1)
         self.assertEqual(self.registry(self, {'x': 'b'}), 1)
         self.assertEqual(self.registry(self, {'x': 'c'}), None)
@@ -92,3 +116,37 @@ class RegistryTests(unittest.TestCase):
         self.assertEqual(self.registry(self, {'x': 'c', 'y': 'b'}), 3)
         self.assertEqual(self.registry(self, {'x': 'd', 'y': 'a'}), None)
         self.assertEqual(self.registry(self, {'x': 'd', 'y': 'b'}), 3)
+
+    def test_registry_order(self):
+        registry = t.Registry()
+
+        @registry.add(y='a')
+        def handler1(self, item):
+            return 1
+
+        @registry.add(x='a', z='a')
+        def handler2(self, item):
+            return 2
+
+        @registry.add(x=['a', 'b'])
+        def handler3(self, item):
+            return 3
+
+        @registry.add()
+        def default(self, item):
+            return 0
+
+        self.assertEqual(registry.get_keys(), ('x', None))
+        self.assertEqual(registry(self, {'x': 'a', 'y': 'a', 'z': 'a'}), 1)
+        self.assertEqual(registry(self, {'x': 'a', 'z': 'a'}), 2)
+        self.assertEqual(registry(self, {'x': 'a'}), 3)
+        self.assertEqual(registry(self, {'x': 'c', 'y': 'a'}), 1)
+        self.assertEqual(registry(self, {'x': 'c'}), 0)
+        self.assertEqual(registry(self, {'x': ['a'], 'y': 'a'}), 1)
+        self.assertEqual(registry(self, {'x': ['a']}), 0)
+
+        @registry.add(x='c')
+        def handler4(self, item):
+            return 4
+
+        self.assertEqual(registry(self, {'x': 'c'}), 4)
@@ -1,4 +1,7 @@
 import collections
+import contextlib
+import functools
+import os
 from datetime import datetime
 
 
@@ -19,15 +22,72 @@ def get_items(data, items, *, type_=str):
 
 
 def convert_datetime(timestr):
+    return _convert_seconds(timestr.split('.')[0].split('+')[0])
+
+
+@functools.lru_cache(maxsize=65536)
+def _convert_seconds(timestr):
+    # Slice the YYYY-mm-ddTHH:MM:SS form edX writes, days past the 28th
+    # are left to strptime to check against the month.
+    if (len(timestr) == 19 and timestr[4] == timestr[7] == '-'
+            and timestr[10] == 'T' and timestr[13] == timestr[16] == ':'):
+        (year, month, day) = (timestr[0:4], timestr[5:7], timestr[8:10])
+        (hour, minute, second) = (
+            timestr[11:13], timestr[14:16], timestr[17:19])
+        if (year + month + day + hour + minute + second).isdigit() and (
+                '01' <= month <= '12' and '01' <= day <= '28'
+                and hour <= '23' and minute <= '59' and second <= '59'):
+            return '{}.{}.{} {}:{}:{}'.format(
+                day, month, year, hour, minute, second)
+
     return datetime.strptime(
-        timestr.split('.')[0].split('+')[0],
-        '%Y-%m-%dT%H:%M:%S').strftime('%d.%m.%Y %H:%M:%S')
+        timestr, '%Y-%m-%dT%H:%M:%S').strftime('%d.%m.%Y %H:%M:%S')
+
+
+def get_course_name(course_id):
+    return course_id.split(':', 1)[-1]
+
+
+def get_course_dirnames(course_names):
+    """
+    Map the course names to distinct directory names. The `/` of the old
+    style `Org/Course/Run` ids become `+`, as in the new style ids, and
+    a number is appended to a name already taken.
+    """
+    dirnames = collections.OrderedDict()
+    taken = set()
+    for course_name in course_names:
+        dirname = base = course_name.replace('/', '+').replace(os.sep, '+')
+        number = 1
+        while dirname in taken:
+            number += 1
+            dirname = '{}-{}'.format(base, number)
+        taken.add(dirname)
+        dirnames[course_name] = dirname
+    return dirnames
+
+
+def in_course(usage_key, course_name):
+    """
+    Check that the usage key belongs to the course. Keys without the course
+    part, like `type@problem+block@id`, are taken to belong to any course.
+    """
+    (prefix, sep, _) = usage_key.partition('+type@')
+    if not sep or ':' not in prefix:
+        return True
+    return get_course_name(prefix) == course_name
 
 
 def iscollection(type_):
     return isinstance(type_, (tuple, list, set, frozenset))
 
 
+@contextlib.contextmanager
+def nullcontext():
+    # contextlib.nullcontext appeared only in Python 3.7
+    yield
+
+
 class NonEmptyMixin:
     def __setitem__(self, key, value):
         if value or (key not in self):
@@ -43,11 +103,23 @@ class NonEmptyOrderedDict(NonEmptyMixin, collections.OrderedDict):
 
 
 class Registry:
+    """
+    Dispatches items to the first registered handler whose keyword
+    conditions all match.
+
+    Handlers are compiled into a table keyed on the values of the most
+    used condition key (`event_type` for log parsers), so an item only
+    checks the handlers registered for its own value, and an item
+    matching no value goes straight to the default handler.
+    """
     _NULL = object()
 
     def __init__(self):
         self.handlers = []
         self.default = lambda obj, item: None
+        self._key = None
+        self._table = None
+        self._rest = []
 
     def add(self, **kwargs):
         def wrapper(func):
@@ -56,6 +128,7 @@ class Registry:
                     key: (value if iscollection(value) else [value])
                     for (key, value) in kwargs.items()
                 }, func))
+                self._table = None
             else:
                 self.default = func
             return func
@@ -68,8 +141,51 @@ class Registry:
                 return False
         return True
 
+    def compile(self):
+        counts = collections.Counter(
+            key for (kwargs, _) in self.handlers for key in kwargs)
+        self._key = counts.most_common(1)[0][0] if counts else None
+
+        table = collections.defaultdict(list)
+        self._rest = []
+        for (order, (kwargs, func)) in enumerate(self.handlers):
+            if self._key in kwargs:
+                rest = {key: values for (key, values) in kwargs.items()
+                        if key != self._key}
+                for value in kwargs[self._key]:
+                    table[value].append((order, rest, func))
+            else:
+                self._rest.append((order, kwargs, func))
+
+        # handlers without the key apply to every value, keep their order
+        self._table = {
+            value: [(rest, func) for (_, rest, func)
+                    in sorted(handlers + self._rest, key=lambda h: h[0])]
+            for (value, handlers) in table.items()}
+        self._rest = [(kwargs, func) for (_, kwargs, func) in self._rest]
+
+    def get_keys(self):
+        """
+        Return the condition key the table is built on and its values.
+        The values are None if some handler does not check the key.
+        """
+        if self._table is None:
+            self.compile()
+        return (self._key, None if self._rest else set(self._table))
+
+    def resolve(self, item):
+        """Return the handler the item is dispatched to."""
+        if self._table is None:
+            self.compile()
+        try:
+            handlers = self._table.get(
+                item.get(self._key, Registry._NULL), self._rest)
+        except TypeError:
+            handlers = self._rest
+        for (kwargs, func) in handlers:
+            if not kwargs or Registry.check_item(item, kwargs):
+                return func
+        return self.default
+
     def __call__(self, obj, item):
-        for (kwargs, func) in self.handlers:
-            if Registry.check_item(item, kwargs):
-                return func(obj, item)
-        return self.default(obj, item)
+        return self.resolve(item)(obj, item)
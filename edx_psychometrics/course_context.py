@@ -0,0 +1,104 @@
+"""
+Course structure snapshot shared by the stages of a report run.
+"""
+import collections
+
+from courseware.courses import get_course_by_id
+from opaque_keys.edx.keys import CourseKey
+from openedx.core.djangoapps.content.course_structures.models import CourseStructure
+
+from edx_psychometrics.utils import PsychometricsPartsStore
+
+
+class CourseContext(object):
+    """
+    The course structure and the descriptor tree data, loaded and decoded once per report run.
+
+    `blocks` maps usage keys to the `ordered_blocks` entries of the CourseStructure
+    (`usage_key`, `block_type`, `display_name`, `children`), in course order.
+    `hidden` holds the chapters and sequentials hidden from the table of contents.
+    The snapshot is plain data, so it may be stored for the report subtasks.
+    """
+    BLOCK_FIELDS = ('usage_key', 'block_type', 'display_name', 'children')
+
+    def __init__(self, course_id, display_name, course_version, blocks, hidden):
+        self.course_id = course_id
+        self.display_name = display_name
+        self.course_version = course_version
+        self.blocks = blocks
+        self.hidden = set(hidden)
+
+        self.chapters = [block for block in blocks.values() if block['block_type'] == 'chapter']
+        self.module_order = dict((chapter['usage_key'], order) for order, chapter in enumerate(self.chapters))
+
+    @classmethod
+    def build(cls, course_id):
+        course = get_course_by_id(course_id)
+        structure = CourseStructure.objects.get(course_id=course_id).ordered_blocks
+
+        blocks = collections.OrderedDict()
+        for usage_key, block in structure.items():
+            blocks[usage_key] = dict((field, block.get(field)) for field in cls.BLOCK_FIELDS)
+            blocks[usage_key]['children'] = blocks[usage_key]['children'] or []
+
+        hidden = []
+        for chapter in course.get_children():
+            if chapter.hide_from_toc:
+                hidden.append(str(chapter.location))
+            for sequential in chapter.get_children():
+                if sequential.hide_from_toc:
+                    hidden.append(str(sequential.location))
+
+        course_version = getattr(course, 'course_version', None) or getattr(course, 'subtree_edited_on', None)
+        return cls(
+            course_id,
+            course.display_name,
+            str(course_version) if course_version is not None else None,
+            blocks,
+            hidden,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        blocks = collections.OrderedDict((block['usage_key'], block) for block in data['blocks'])
+        return cls(
+            CourseKey.from_string(data['course_id']),
+            data['display_name'],
+            data['course_version'],
+            blocks,
+            data['hidden'],
+        )
+
+    def to_dict(self):
+        return {
+            'course_id': unicode(self.course_id),
+            'display_name': self.display_name,
+            'course_version': self.course_version,
+            'blocks': list(self.blocks.values()),
+            'hidden': sorted(self.hidden),
+        }
+
+    def save(self, filename):
+        PsychometricsPartsStore().save_json(self.course_id, filename, self.to_dict())
+
+    @classmethod
+    def load(cls, course_id, filename):
+        return cls.from_dict(PsychometricsPartsStore().load_json(course_id, filename))
+
+    def visible_chapters(self):
+        return [chapter for chapter in self.chapters if chapter['usage_key'] not in self.hidden]
+
+    def children(self, block):
+        return [self.blocks[child] for child in block['children'] if child in self.blocks]
+
+    def iter_items(self, include_hidden=True):
+        """
+        Yield `(chapter, sequential, vertical, item)` for every block of the course verticals.
+        """
+        for chapter in self.chapters if include_hidden else self.visible_chapters():
+            for sequential in self.children(chapter):
+                if not include_hidden and sequential['usage_key'] in self.hidden:
+                    continue
+                for vertical in self.children(sequential):
+                    for item in self.children(vertical):
+                        yield chapter, sequential, vertical, item
@@ -4,6 +4,7 @@ from functools import partial
 from celery import task
 from django.conf import settings
 from django.utils.translation import ugettext_noop
+from opaque_keys.edx.keys import CourseKey
 
 from lms.djangoapps.instructor_task.tasks_helper.runner import run_main_task
 from lms.djangoapps.instructor_task.tasks_base import BaseInstructorTask
@@ -23,6 +24,33 @@ def get_psychometrics_data(entry_id, xmodule_instance_args):
     return run_main_task(entry_id, task_fn, action_name)
 
 
+@task(base=BaseInstructorTask, routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=not-callable
+def generate_psychometrics_stage(entry_id, course_id, stage, task_input):
+    """
+    Generate one file of the psychometrics reports archive.
+    """
+    TASK_LOG.info(u"Psychometrics stage %s of %s started, entry %s", stage, course_id, entry_id)
+    return PsychometricsReport.generate_stage(entry_id, CourseKey.from_string(course_id), stage, task_input)
+
+
+@task(base=BaseInstructorTask, routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=not-callable
+def assemble_psychometrics_archive(entry_id, course_id, timestamp, output_format='csv'):
+    """
+    Zip the generated psychometrics files into the reports archive.
+    """
+    TASK_LOG.info(u"Psychometrics archive of %s assembling, entry %s", course_id, entry_id)
+    return PsychometricsReport.assemble_archive(entry_id, CourseKey.from_string(course_id), timestamp, output_format)
+
+
+@task(base=BaseInstructorTask, routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=not-callable
+def delete_psychometrics_parts(entry_id, course_id, output_format='csv'):
+    """
+    Drop the stored files of a psychometrics report whose subtask failed.
+    """
+    TASK_LOG.warning(u"Psychometrics report of %s failed, deleting its stored files, entry %s", course_id, entry_id)
+    PsychometricsReport.delete_parts(entry_id, CourseKey.from_string(course_id), output_format)
+
+
 @task(base=BaseInstructorTask, routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)
 def get_views_data(entry_id, xmodule_instance_args):
     """
@@ -1,33 +1,40 @@
-import collections
+import calendar
+import copy
 import json
 import logging
+import os
 from datetime import datetime
 from time import time
+from uuid import uuid4
 
-import pytz
-from capa import responsetypes
-from courseware.courses import get_course_by_id
-from courseware.models import StudentModule
-from courseware.user_state_client import DjangoXBlockUserStateClient
-from django.conf import settings
-from lms.djangoapps.grades.new.course_grade_factory import CourseGradeFactory
+from capa import inputtypes, responsetypes
+from celery import chord, current_task
+from celery.states import SUCCESS
+from django.core.cache import cache
+from django.db import transaction
 from lms.djangoapps.instructor.utils import get_module_for_student
+from lms.djangoapps.instructor_task.models import InstructorTask
+from lms.djangoapps.instructor_task.subtasks import initialize_subtask_info, update_subtask_status, SubtaskStatus
 from lms.djangoapps.instructor_task.tasks_helper.runner import TaskProgress
 from lxml import etree
-from opaque_keys.edx.keys import CourseKey, UsageKey
-# ORA
-from openassessment.assessment.models import Assessment
-from openedx.core.djangoapps.content.course_structures.models import CourseStructure
+from opaque_keys.edx.keys import UsageKey
 from pytz import UTC
 from student.models import CourseEnrollment, user_by_anonymous_id
 from student.roles import CourseInstructorRole, CourseStaffRole
 from xmodule.modulestore.django import modulestore
 
-from edx_psychometrics.utils import get_course_item_submissions, _use_read_replica, write_to_csv_by_semicolon, \
-    PsychometricsReportStore, ViewsReportStore, EnrollmentsReportStore
+from edx_psychometrics.course_context import CourseContext
+from edx_psychometrics.utils import write_to_csv_by_semicolon, write_to_json, write_to_parquet, get_course_enrollments, \
+    get_visited_sequentials_index, get_sequential_positions_index, get_course_problems_history, get_history_tables, \
+    get_course_problems_history_totals, add_to_totals, read_keyed_csv, merge_keyed_rows, \
+    get_problem_metadata_cache_key, get_anonymous_ids_map, get_course_item_submission_chunks, \
+    get_submissions_assessments, get_submissions_assessments_totals, format_stage_metrics, StageMetrics, \
+    PsychometricsReportStore, PsychometricsPartsStore, ViewsReportStore, EnrollmentsReportStore
 
 log = logging.getLogger(__name__)
 
+PROBLEM_METADATA_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
 
 class EnrollmentsReport(object):
     enrollments_reports_store = EnrollmentsReportStore()
@@ -43,32 +50,19 @@ class EnrollmentsReport(object):
         num_reports = 1
         task_progress = TaskProgress(action_name, num_reports, start_time)
 
-        enrolled_students = CourseEnrollment.objects.users_enrolled_in(course_id, include_inactive=True)
-
         current_step = {'step': 'Get enrollments'}
-        views_rows = cls._get_views_data(course_id, enrolled_students)
-        csv_file = write_to_csv_by_semicolon(views_rows)
+        enrollments_rows = cls._get_enrollments_data(course_id)
+        csv_file = write_to_csv_by_semicolon(enrollments_rows)
         cls.enrollments_reports_store.save_csv(course_id, "enrollments", csv_file, start_date)
         return task_progress.update_task_state(extra_meta=current_step)
 
     @classmethod
-    def _get_views_data(cls, course_id, enrolled_students):
-        course = get_course_by_id(course_id)
-        rows = []
+    def _get_enrollments_data(cls, course_id):
         headers = ['user_id', 'email', "created", "mode"]
+        yield headers
 
-        for student in enrolled_students:
-            row = [str(student), student.email]
-            enrollments = CourseEnrollment.default_objects.filter(user=student, course_id=course_id)
-            for enrollment in enrollments:
-                row += [
-                    enrollment.created.strftime("%d.%m.%Y"),
-                    enrollment.mode
-                ]
-                rows.append(row)
-
-        rows.insert(0, headers)
-        return rows
+        for username, email, created, mode in get_course_enrollments(course_id):
+            yield [username, email, created.strftime("%d.%m.%Y"), mode]
 
 
 class ViewsReport(object):
@@ -95,317 +89,564 @@ class ViewsReport(object):
 
     @classmethod
     def _get_views_data(cls, course_id, enrolled_students):
-        course = get_course_by_id(course_id)
-        rows = []
+        context = CourseContext.build(course_id)
         headers = ['user_id', 'email']
-        structure = CourseStructure.objects.get(course_id=course_id).ordered_blocks
-        sections = [s for s in course.get_children() if not s.hide_from_toc]
 
-        for subsection in sections:
-            headers += [structure[str(sub.location)]['display_name'] for sub in subsection.get_children()]
+        subsection_keys = []
+        for section in context.visible_chapters():
+            for subsection in context.children(section):
+                headers.append(subsection['display_name'])
+                subsection_keys.append(subsection['usage_key'])
+        yield headers
 
+        visited_index = get_visited_sequentials_index(course_id)
         for student in enrolled_students:
+            visited = visited_index.get(student.id, ())
             row = [str(student), student.email]
-            for section in sections:
-                for subsection in section.get_children():
-                    module = StudentModule.objects.filter(student=student, module_type='sequential',
-                                                          module_state_key=subsection.location).first()
-                    row.append(1 if module else 0)
-            rows.append(row)
-
-        rows.insert(0, headers)
-        return rows
+            row += [1 if key in visited else 0 for key in subsection_keys]
+            yield row
 
 
 class PsychometricsReport(object):
-    archive = PsychometricsReportStore()
+    # (stage, file name inside the archive)
+    STAGES = (
+        ('csv1', 'csv1.csv'),
+        ('csv2', 'csv2.csv'),
+        ('csv3', 'csv3.csv'),
+        ('csv4', 'csv4.csv'),
+        ('csv5', 'csv5.csv'),
+        ('course', 'course.json'),
+    )
+    # Stages built from append-only data, which may be updated incrementally: stage -> row key types
+    INCREMENTAL_KEYS = {
+        'csv1': (int, unicode, int),  # student module id, history table, history id
+        'csv5': (unicode, int, int),  # openassessment usage key, submission id, assessment id
+    }
+    # Version of the incremental state, older states are rebuilt
+    INCREMENTAL_STATE_VERSION = 3
+    # Output format: (table writer, table file extension)
+    OUTPUT_FORMATS = {
+        'csv': (write_to_csv_by_semicolon, '.csv'),
+        'parquet': (write_to_parquet, '.parquet'),
+    }
 
     @classmethod
-    def generate(cls, _xmodule_instance_args, _entry_id, course_id, task_input, action_name):
+    def generate(cls, _xmodule_instance_args, entry_id, course_id, task_input, action_name):
         """
-        For a given `course_id`, generate a 5 CSV files containing
-        information about the learning process
+        For a given `course_id`, schedule generation of 5 CSV files containing
+        information about the learning process.
+
+        Every file is built by its own subtask; the archive is assembled
+        by a chord callback once all of them are stored. If a subtask fails,
+        the error callback drops the stored files instead.
         """
-        start_time = time()
-        start_date = datetime.now(UTC)
-        num_reports = 1
-        task_progress = TaskProgress(action_name, num_reports, start_time)
+        from edx_psychometrics.tasks import (
+            generate_psychometrics_stage, assemble_psychometrics_archive, delete_psychometrics_parts
+        )
 
-        enrolled_students = CourseEnrollment.objects.users_enrolled_in(course_id, include_inactive=True)
-        problems = []
-
-        # Generating Generating CSV1
-        current_step = {'step': 'Calculating CSV1'}
-        rows1, problems = cls._get_csv1_data(course_id, enrolled_students, problems)
-        task_progress.update_task_state(extra_meta=current_step)
-
-        # Generating CSV2
-        current_step = {'step': 'Calculating CSV2'}
-        rows2, problems = cls._get_csv2_data(course_id, problems)
-
-        problems = [item for item, count in collections.Counter(problems).items() if count > 1]
-        problems.append("item_id")
-        # rows1 = [r for r in rows1 if r[1] in problems]
-        # rows2 = [r for r in rows2 if r[0] in problems] # for openprofession
-        file_csv1 = write_to_csv_by_semicolon(rows1)
-        cls.archive.append_csv("csv1", file_csv1)
-        file_csv2 = write_to_csv_by_semicolon(rows2)
-        cls.archive.append_csv("csv2", file_csv2)
-        task_progress.update_task_state(extra_meta=current_step)
-
-        # Generating CSV3
-        current_step = {'step': 'Calculating CSV3'}
-        file_csv3 = cls._get_csv3_data(course_id, enrolled_students)
-        cls.archive.append_csv("csv3", file_csv3)
-        task_progress.update_task_state(extra_meta=current_step)
-
-        # Generating CSV4
-        current_step = {'step': 'Calculating CSV4'}
-        file_csv4 = cls._get_csv4_data(course_id)
-        cls.archive.append_csv("csv4", file_csv4)
-        task_progress.update_task_state(extra_meta=current_step)
-
-        # Generating CSV5
-        current_step = {'step': 'Calculating CSV5'}
-        file_csv5 = cls._get_csv5_data(course_id)
-        cls.archive.append_csv("csv5", file_csv5)
-        task_progress.update_task_state(extra_meta=current_step)
-
-        # Generating course description json
-        current_step = {'step': 'Calculating description json'}
-        data_json = cls._get_course_json_data(course_id)
-        cls.archive.append_json("course", data_json)
-        task_progress.update_task_state(extra_meta=current_step)
-
-        cls.archive.save_archive(course_id, "psychometrics_data", start_date)
+        CourseContext.build(course_id).save(cls._get_context_name(entry_id))
 
-        return task_progress.update_task_state(extra_meta=current_step)
+        entry = InstructorTask.objects.get(pk=entry_id)
+        stage_task_ids = [str(uuid4()) for _ in cls.STAGES]
+        assemble_task_id = str(uuid4())
+        task_progress = initialize_subtask_info(
+            entry, action_name, len(cls.STAGES) + 1, stage_task_ids + [assemble_task_id]
+        )
+
+        header = [
+            generate_psychometrics_stage.si(entry_id, unicode(course_id), stage, task_input).set(task_id=task_id)
+            for (stage, _), task_id in zip(cls.STAGES, stage_task_ids)
+        ]
+        output_format = cls._get_output_format(task_input)
+        callback = assemble_psychometrics_archive.si(
+            entry_id, unicode(course_id), time(), output_format
+        ).set(task_id=assemble_task_id)
+        callback.link_error(delete_psychometrics_parts.si(entry_id, unicode(course_id), output_format))
+        chord(header)(callback)
+
+        return task_progress
 
     @classmethod
-    def _get_csv1_data(cls, course_id, enrolled_students, problems):
-        user_state_client = DjangoXBlockUserStateClient()
-        course = get_course_by_id(course_id)
-        headers = ('user_id', 'item_id', 'correct', 'time')
-        rows = []
+    def generate_stage(cls, entry_id, course_id, stage, task_input):
+        """
+        Build one file of the archive and keep it in the parts store until assembly.
 
-        for student, course_grade, error in CourseGradeFactory().iter(enrolled_students, course):
-            student_modules = StudentModule.objects.filter(
-                student=student,
-                course_id=course_id,
-                module_type='problem'
+        Returns the stage metrics, which are also kept for the archive assembly.
+        """
+        metrics = StageMetrics()
+        with metrics:
+            context = CourseContext.load(course_id, cls._get_context_name(entry_id))
+            enrolled_students = CourseEnrollment.objects.users_enrolled_in(course_id, include_inactive=True)
+            output_format = cls._get_output_format(task_input)
+            write_table = cls.OUTPUT_FORMATS[output_format][0]
+
+            def write_rows(rows):
+                return write_table(metrics.count_rows(rows))
+
+            if stage == 'course':
+                part_file = write_to_json(cls._get_course_json_data(context))
+            elif task_input.get('incremental') and stage in cls.INCREMENTAL_KEYS:
+                part_file = cls._get_incremental_part(entry_id, context, stage, enrolled_students, write_rows)
+            else:
+                stage_rows = {
+                    'csv1': cls._get_csv1_data(course_id, enrolled_students),
+                    'csv2': cls._get_csv2_data(context, task_input.get('lightweight_problem_metadata')),
+                    'csv3': cls._get_csv3_data(context, enrolled_students),
+                    'csv4': cls._get_csv4_data(context),
+                    'csv5': cls._get_csv5_data(context),
+                }
+                part_file = write_rows(stage_rows[stage])
+
+            parts_store = PsychometricsPartsStore()
+            parts_store.save(course_id, cls._get_part_name(entry_id, stage, output_format), part_file)
+            part_file.close()
+
+        stage_metrics = metrics.to_dict()
+        log.info(u"Psychometrics stage %s of %s finished: %s", stage, course_id, format_stage_metrics(stage_metrics))
+        parts_store.save_json(course_id, cls._get_metrics_name(entry_id, stage), stage_metrics)
+
+        cls._update_subtask_status(entry_id)
+        return stage_metrics
+
+    @classmethod
+    def _get_incremental_part(cls, entry_id, context, stage, enrolled_students, write_rows=write_to_csv_by_semicolon):
+        """
+        Build the stage file from the partial output of the previous run plus the rows added since.
+
+        The partial output keeps the key of every row, and the state keeps the
+        count, the id sum and the largest id of the source rows read per table.
+        Only rows past the largest ids are queried, and the merged rows keep
+        exactly the order of a from-scratch run.
+
+        Ids are not always committed in order, and source rows may be deleted
+        or stop qualifying (a module state losing its `correct_map`). These
+        change the count or the id sum of the rows up to the largest ids, which
+        the database recounts on every run; the partial is then rebuilt from scratch,
+        as it is when the state or the partial is missing or unreadable.
+        Learners are filtered by enrollment only when the stage file is
+        written, so later enrollments pick up their earlier activity.
+        """
+        course_id = context.course_id
+        parts_store = PsychometricsPartsStore()
+        state_name = u"state_{stage}.json".format(stage=stage)
+        tables = get_history_tables() if stage == 'csv1' else ['assessment']
+        key_types = cls.INCREMENTAL_KEYS[stage]
+
+        try:
+            stored_state = parts_store.load_json(course_id, state_name)
+        except ValueError:
+            log.warning(u"Psychometrics %s state of %s is not readable, rebuilding it", stage, course_id)
+            stored_state = None
+        if not isinstance(stored_state, dict):
+            stored_state = None
+        state = stored_state
+        if not (
+            state and state.get('version') == cls.INCREMENTAL_STATE_VERSION and state.get('tables') == tables and
+            parts_store.exists(course_id, state['partial'])
+        ):
+            state = None
+        if state is not None:
+            watermarks = dict((table, total[2]) for table, total in state['totals'].items())
+            stored_totals = dict((table, total[:2]) for table, total in state['totals'].items())
+            if cls._get_incremental_totals(context, stage, watermarks) != stored_totals:
+                log.info(u"Psychometrics %s of %s changed before the last processed rows, rebuilding it", stage, course_id)
+                state = None
+
+        if state is not None:
+            previous_file = parts_store.fetch(course_id, state['partial'])
+            previous_rows = read_keyed_csv(previous_file, key_types)
+            totals = copy.deepcopy(state['totals'])
+        else:
+            previous_file = None
+            previous_rows = []
+            watermarks = {}
+            totals = {}
+
+        if stage == 'csv1':
+            new_rows = cls._get_csv1_keyed_rows(course_id, watermarks, totals)
+        else:
+            new_rows = cls._get_csv5_keyed_rows(context, watermarks, totals)
+
+        partial_file = write_to_csv_by_semicolon(merge_keyed_rows(len(key_types), previous_rows, new_rows))
+        if previous_file is not None:
+            previous_file.close()
+
+        partial_name = u"state_{entry_id}_{stage}.csv".format(entry_id=entry_id, stage=stage)
+        parts_store.save(course_id, partial_name, partial_file)
+        parts_store.save_json(course_id, state_name, {
+            'version': cls.INCREMENTAL_STATE_VERSION,
+            'tables': tables,
+            'totals': totals,
+            'partial': partial_name,
+        })
+        if stored_state and stored_state.get('partial') != partial_name:
+            parts_store.delete(course_id, stored_state['partial'])
+
+        partial_file.seek(0)
+        if stage == 'csv1':
+            stage_rows = cls._get_csv1_data(course_id, enrolled_students, read_keyed_csv(partial_file, key_types))
+        else:
+            stage_rows = cls._get_csv5_data(context, read_keyed_csv(partial_file, key_types))
+        part_file = write_rows(stage_rows)
+        partial_file.close()
+        return part_file
+
+    @classmethod
+    def _get_incremental_totals(cls, context, stage, watermarks):
+        """
+        Return `{table: [row count, id sum]}` of the stage source rows up to the `watermarks`.
+        """
+        if stage == 'csv1':
+            return get_course_problems_history_totals(context.course_id, watermarks)
+
+        totals = {}
+        if 'assessment' in watermarks:
+            totals['assessment'] = [0, 0]
+            for _, submissions in cls._iter_openassessment_submissions(context):
+                count, id_sum = get_submissions_assessments_totals(list(submissions), watermarks['assessment'])
+                totals['assessment'][0] += count
+                totals['assessment'][1] += id_sum
+        return totals
+
+    @classmethod
+    def assemble_archive(cls, entry_id, course_id, timestamp, output_format='csv'):
+        """
+        Zip the stored stage files into the final archive and drop the parts.
+
+        The metrics of the stages are logged and merged into the task output of the entry.
+        """
+        parts_store = PsychometricsPartsStore()
+        archive = PsychometricsReportStore()
+        for stage, _ in cls.STAGES:
+            part_name = cls._get_part_name(entry_id, stage, output_format)
+            archive.append_file(cls._get_filename(stage, output_format), parts_store.fetch(course_id, part_name))
+        archive.save_archive(course_id, "psychometrics_data", datetime.fromtimestamp(timestamp, UTC))
+
+        stage_metrics = {}
+        for stage, _ in cls.STAGES:
+            stage_metrics[stage] = parts_store.load_json(course_id, cls._get_metrics_name(entry_id, stage))
+            if stage_metrics[stage] is not None:
+                log.info(
+                    u"Psychometrics report of %s, stage %s: %s",
+                    course_id, stage, format_stage_metrics(stage_metrics[stage])
+                )
+        cls.delete_parts(entry_id, course_id, output_format)
+
+        cls._save_stage_metrics(entry_id, stage_metrics)
+        cls._update_subtask_status(entry_id)
+        return stage_metrics
+
+    @classmethod
+    def delete_parts(cls, entry_id, course_id, output_format='csv'):
+        """
+        Drop the stage files, the stage metrics and the course context stored for the report.
+
+        The incremental state is kept for the next reports.
+        """
+        parts_store = PsychometricsPartsStore()
+        for stage, _ in cls.STAGES:
+            parts_store.delete(course_id, cls._get_part_name(entry_id, stage, output_format))
+            parts_store.delete(course_id, cls._get_metrics_name(entry_id, stage))
+        parts_store.delete(course_id, cls._get_context_name(entry_id))
+
+    @classmethod
+    def _save_stage_metrics(cls, entry_id, stage_metrics):
+        """
+        Merge the stage metrics into the `task_output` of the entry, which the instructor dashboard reads.
+
+        The entry row is locked for the update like `update_subtask_status` does, which
+        keeps the other keys of the output. The output is limited to 1024 characters, so
+        every stage is stored as the list of its `StageMetrics.FIELDS` values.
+        """
+        with transaction.atomic():
+            entry = InstructorTask.objects.select_for_update().get(pk=entry_id)
+            task_output = json.loads(entry.task_output) if entry.task_output else {}
+            task_output['stage_metrics_fields'] = StageMetrics.FIELDS
+            task_output['stage_metrics'] = dict(
+                (stage, [metrics[field] for field in StageMetrics.FIELDS])
+                for stage, metrics in stage_metrics.items() if metrics is not None
             )
+            try:
+                entry.task_output = InstructorTask.create_output_for_success(task_output)
+            except ValueError:
+                log.warning(u"Psychometrics stage metrics of entry %s do not fit the task output", entry_id)
+                return
+            entry.save()
+
+    @classmethod
+    def _get_output_format(cls, task_input):
+        output_format = task_input.get('output_format') or 'csv'
+        return output_format if output_format in cls.OUTPUT_FORMATS else 'csv'
+
+    @classmethod
+    def _get_filename(cls, stage, output_format='csv'):
+        filename = dict(cls.STAGES)[stage]
+        name, extension = os.path.splitext(filename)
+        if extension == '.csv':
+            extension = cls.OUTPUT_FORMATS[output_format][1]
+        return name + extension
+
+    @classmethod
+    def _get_part_name(cls, entry_id, stage, output_format='csv'):
+        return u"{entry_id}_{filename}".format(entry_id=entry_id, filename=cls._get_filename(stage, output_format))
+
+    @classmethod
+    def _get_metrics_name(cls, entry_id, stage):
+        return u"{entry_id}_metrics_{stage}.json".format(entry_id=entry_id, stage=stage)
 
-            for s in student_modules:
-                if s.state:
-                    if "correct_map" in s.state:
-                        try:
-                            history_entries = list(user_state_client.get_history(student.username, s.module_state_key))
-                            for e in history_entries:
-                                if "correct_map" in e.state:
-                                    for item in e.state["correct_map"]:
-                                        rows.append([
-                                            s.student.id,
-                                            item,
-                                            1 if e.state["correct_map"][item]["correctness"] == "correct" else 0,
-                                            e.updated.astimezone(pytz.timezone(settings.TIME_ZONE)).strftime(
-                                                "%d.%m.%Y %H:%M:%S")
-                                        ])
-                        except Exception as e:
-                            log.info("Get history: " + str(e))
-
-        problems += [r[1] for r in rows]
-        rows.insert(0, headers)
-        return rows, list(set(problems))
+    @classmethod
+    def _get_context_name(cls, entry_id):
+        return u"{entry_id}_context.json".format(entry_id=entry_id)
+
+    @classmethod
+    def _update_subtask_status(cls, entry_id):
+        task_id = current_task.request.id
+        update_subtask_status(entry_id, task_id, SubtaskStatus.create(task_id, succeeded=1, state=SUCCESS))
+
+    @classmethod
+    def _get_csv1_data(cls, course_id, enrolled_students, keyed_rows=None):
+        headers = ('user_id', 'item_id', 'correct', 'time')
+        enrolled_ids = set(enrolled_students.values_list('id', flat=True))
+        if keyed_rows is None:
+            keyed_rows = cls._get_csv1_keyed_rows(course_id)
+        yield headers
+
+        key_size = len(cls.INCREMENTAL_KEYS['csv1'])
+        for keyed_row in keyed_rows:
+            row = keyed_row[key_size:]
+            if int(row[0]) in enrolled_ids:
+                row[-1] = datetime.fromtimestamp(int(row[-1]), UTC)
+                yield row
+
+    @classmethod
+    def _get_csv1_keyed_rows(cls, course_id, watermarks=None, totals=None):
+        """
+        Yield `(student module id, history table, history id, user_id, item_id, correct, time)`
+        for the course problems history, the time in epoch seconds.
+        """
+        history = get_course_problems_history(course_id, watermarks, totals)
+        for module_id, table, history_id, student_id, state, created in history:
+            correct_map = state.get("correct_map") or {}
+            updated = calendar.timegm(created.utctimetuple())
+            for item in correct_map:
+                yield [
+                    module_id,
+                    table,
+                    history_id,
+                    student_id,
+                    item,
+                    1 if correct_map[item].get("correctness") == "correct" else 0,
+                    updated
+                ]
 
     @classmethod
-    def _get_csv2_data(cls, course_id, problems):
-        structure = CourseStructure.objects.get(course_id=course_id).ordered_blocks
+    def _get_csv2_data(cls, context, lightweight=False):
         headers = ('item_id', 'item_type', 'item_name', 'module_id', 'module_order', 'module_name')
-        instructors = set(CourseInstructorRole(CourseKey.from_string(str(course_id))).users_with_role())
-        # the page only lists staff and assumes they're a superset of instructors. Do a union to ensure.
-        user = list(set(CourseStaffRole(CourseKey.from_string(str(course_id))).users_with_role()).union(instructors))[0]
+        course_id = context.course_id
+        users = []
+
+        def _get_user():
+            if not users:
+                instructors = set(CourseInstructorRole(course_id).users_with_role())
+                # the page only lists staff and assumes they're a superset of instructors. Do a union to ensure.
+                users.append(list(set(CourseStaffRole(course_id).users_with_role()).union(instructors))[0])
+            return users[0]
+
+        yield headers
+
+        for chapter, _, _, item in context.iter_items():
+            if item['block_type'] == 'problem':
+                problems = [item]
+            elif item['block_type'] == 'library_content':
+                problems = [lib_item for lib_item in context.children(item) if lib_item['block_type'] == 'problem']
+            elif item['block_type'] in ('openassessment', 'edx_sga'):
+                problems = []
+                row = [
+                    item['usage_key'].split("@")[-1],
+                    item['block_type'],
+                    item['display_name'],
+                    chapter['usage_key'].split("@")[-1],
+                    context.module_order[chapter['usage_key']],
+                    chapter['display_name']
+                ]
+                yield row
+            else:
+                problems = []
+
+            for problem in problems:
+                usage_key = UsageKey.from_string(problem['usage_key'])
+                metadata = cls._get_problem_metadata(usage_key, context.course_version, _get_user, lightweight)
+                if metadata is None:
+                    continue
+                state_inputs, response_types = metadata
+                for idx, input_state in enumerate(state_inputs):
+                    row = [
+                        input_state,
+                        response_types[idx],
+                        problem['display_name'],
+                        chapter['usage_key'].split("@")[-1],
+                        context.module_order[chapter['usage_key']],
+                        chapter['display_name']
+                    ]
+                    yield row
 
-        module_order = 0
-        datarows2 = []
+    @classmethod
+    def _get_problem_metadata(cls, usage_key, course_version, get_user, lightweight=False):
+        """
+        Return `(input ids, response types)` of the problem, or None if it cannot be loaded.
+
+        Metadata is cached per usage key and published course version, so
+        only problems of a changed course are loaded again.
+        """
+        cache_key = None
+        if course_version is not None:
+            cache_key = get_problem_metadata_cache_key(usage_key, course_version, lightweight)
+            metadata = cache.get(cache_key)
+            if metadata is not None:
+                return metadata
+
+        try:
+            if lightweight:
+                metadata = cls._get_problem_metadata_from_olx(usage_key)
+            else:
+                metadata = cls._get_problem_metadata_from_module(usage_key, get_user())
+        except Exception as e:
+            log.info(u"Get problem metadata %s: %s", usage_key, e)
+            return None
+
+        if cache_key is not None:
+            cache.set(cache_key, metadata, PROBLEM_METADATA_CACHE_TIMEOUT)
+        return metadata
+
+    @classmethod
+    def _get_problem_metadata_from_module(cls, usage_key, user):
+        block = get_module_for_student(user, usage_key)
+        state_inputs = list(block.displayable_items()[0].input_state.keys())
+        loncapa_xml_tree = etree.XML(block.data)
         registered_loncapa_tags = responsetypes.registry.registered_tags()
+        response_types = [node.tag for node in loncapa_xml_tree.iter() if
+                          node.tag in registered_loncapa_tags]
+        if len(state_inputs) > len(response_types):
+            while len(state_inputs) != len(response_types):
+                response_types.append(response_types[-1])
+        return state_inputs, response_types
 
-        chapters = [s for s in structure.values() if s['block_type'] == 'chapter']
-        for chapter in chapters:
-            sequentials = chapter['children']
-            for sequential_id in sequentials:
-                sequential = structure[sequential_id]
-                for block_id in sequential['children']:
-                    block = structure[block_id]
-                    for item_id in block['children']:
-                        item = structure[item_id]
-                        if item['block_type'] == 'problem':
-                            try:
-                                usage_key = UsageKey.from_string(item['usage_key'])
-                                block = get_module_for_student(user, usage_key)
-                                state_inputs = block.displayable_items()[0].input_state.keys()
-                                loncapa_xml_tree = etree.XML(block.data)
-                                response_types = [node.tag for node in loncapa_xml_tree.iter() if
-                                                  node.tag in registered_loncapa_tags]
-                                if len(state_inputs) > len(response_types):
-                                    while len(state_inputs) != len(response_types):
-                                        response_types.append(response_types[-1])
-                                for idx, input_state in enumerate(state_inputs):
-                                    row = [
-                                        input_state,
-                                        response_types[idx],
-                                        item['display_name'],
-                                        chapter['usage_key'].split("@")[-1],
-                                        module_order,
-                                        chapter['display_name']
-                                    ]
-                                    datarows2.append(row)
-                            except:
-                                pass
-                        elif item['block_type'] == 'library_content':
-                            for lib_item in item['children']:
-                                current_block_lib = structure[lib_item]
-                                if current_block_lib['block_type'] == 'problem':
-                                    usage_key = UsageKey.from_string(current_block_lib['usage_key'])
-                                    block = get_module_for_student(user, usage_key)
-                                    state_inputs = block.displayable_items()[0].input_state.keys()
-                                    loncapa_xml_tree = etree.XML(block.data)
-                                    response_types = [node.tag for node in loncapa_xml_tree.iter() if
-                                                      node.tag in registered_loncapa_tags]
-                                    for idx, input_state in enumerate(state_inputs):
-                                        row = [
-                                            input_state,
-                                            response_types[idx],
-                                            current_block_lib['display_name'],
-                                            chapter['usage_key'].split("@")[-1],
-                                            module_order,
-                                            chapter['display_name']
-                                        ]
-                                        datarows2.append(row)
-                        elif item['block_type'] == 'openassessment':
-                            row = [
-                                item['usage_key'].split("@")[-1],
-                                item['block_type'],
-                                item['display_name'],
-                                chapter['usage_key'].split("@")[-1],
-                                module_order,
-                                chapter['display_name']
-                            ]
-                            datarows2.append(row)
-
-                        elif item['block_type'] == 'edx_sga':
-                            row = [
-                                item['usage_key'].split("@")[-1],
-                                item['block_type'],
-                                item['display_name'],
-                                chapter['usage_key'].split("@")[-1],
-                                module_order,
-                                chapter['display_name']
-                            ]
-                            datarows2.append(row)
-
-            module_order = module_order + 1
-        problems += [r[0] for r in datarows2]
-        datarows2.insert(0, headers)
-
-        return datarows2, problems
+    @classmethod
+    def _get_problem_metadata_from_olx(cls, usage_key):
+        """
+        Derive input ids the way LoncapaProblem numbers them, straight from the problem OLX.
+
+        The descriptor is read from the modulestore without binding a module to a user.
+        """
+        problem_id = usage_key.html_id()
+        loncapa_xml_tree = etree.XML(modulestore().get_item(usage_key).data)
+        input_tags = inputtypes.registry.registered_tags()
+        state_inputs = []
+        response_types = []
+
+        response_id = 1
+        for response in loncapa_xml_tree.xpath('//' + '|//'.join(responsetypes.registry.registered_tags())):
+            response_id += 1
+            answer_id = 1
+            for _ in response.xpath('|'.join('.//' + tag for tag in input_tags)):
+                state_inputs.append("%s_%i_%i" % (problem_id, response_id, answer_id))
+                response_types.append(response.tag)
+                answer_id += 1
+        return state_inputs, response_types
 
     @classmethod
-    def _get_csv3_data(cls, course_id, enrolled_students):
+    def _get_csv3_data(cls, context, enrolled_students):
         headers = ('user_id', 'content_piece_id', 'viewed', 'subsection')
-        structure = CourseStructure.objects.get(course_id=course_id).ordered_blocks
-
-        rows = []
-
-        course = get_course_by_id(course_id)
-        chapters = [chapter for chapter in course.get_children() if not chapter.hide_from_toc]
-        vertical_map = {}
-        for c in chapters:
-            for s in c.get_children():
-                if not s.hide_from_toc:
-                    vertical_map[s.location] = [t.location for t in s.get_children()]
-
-        def _viewed(_subsection, _vertical, _student):
-            _sm = StudentModule.objects.filter(student=_student,
-                                               module_state_key=_subsection
-                                               ).first()
-            if _sm:
-                position = json.loads(_sm.state)["position"]
-
-                if vertical_map[_subsection].index(_vertical) <= position:
-                    return 1
-                else:
-                    return 0
-            else:
-                return 0
-
+        yield headers
+
+        # (subsection key, subsection id, [(vertical ordinal, video ids)])
+        subsections = []
+        for chapter in context.visible_chapters():
+            for sequential in context.children(chapter):
+                if sequential['usage_key'] not in context.hidden:
+                    verticals = []
+                    for ordinal, vertical in enumerate(context.children(sequential)):
+                        videos = [block.split("@")[-1] for block in vertical["children"] if "video" in block]
+                        if videos:
+                            verticals.append((ordinal, videos))
+                    subsections.append((sequential['usage_key'], sequential['usage_key'].split("@")[-1], verticals))
+
+        positions_index = get_sequential_positions_index(context.course_id)
         for student in enrolled_students:
-            for subsection in vertical_map.keys():
-                for vertical in vertical_map[subsection]:
-                    for block in structure[str(vertical)]["children"]:
-                        if "video" in block:
-                            rows.append([
-                                student.id,
-                                str(block).split("@")[-1],
-                                _viewed(subsection, vertical, student),
-                                str(subsection).split("@")[-1],
-                            ])
-        rows.insert(0, headers)
-
-        file = write_to_csv_by_semicolon(rows)
-        return file
+            positions = positions_index.get(student.id, {})
+            for subsection_key, subsection_id, verticals in subsections:
+                position = positions.get(subsection_key)
+                for ordinal, videos in verticals:
+                    viewed = 1 if position is not None and ordinal <= position else 0
+                    for video_id in videos:
+                        yield [student.id, video_id, viewed, subsection_id]
 
     @classmethod
-    def _get_csv4_data(cls, course_id):
-        structure = CourseStructure.objects.get(course_id=course_id).ordered_blocks
+    def _get_csv4_data(cls, context):
         headers = (
             'content_piece_id', 'content_piece_type', 'content_piece_name', 'module_id', 'module_order', 'module_name')
-        # datarows = []
-        # sequentials = [s for s in structure.values() if s['block_type'] == 'sequential']
-        # module_order = 0
-        # for sequential in sequentials:
-        #     for block in sequential['children']:
-        #         for item in structure[block]['children']:
-        #             row = [
-        #                 structure[item]['usage_key'].split("@")[-1],
-        #                 structure[item]['block_type'],
-        #                 structure[item]['display_name'],
-        #                 sequential['usage_key'].split("@")[-1],
-        #                 module_order,
-        #                 sequential['display_name']
-        #             ]
-        #             datarows.append(row)
-        #     module_order += 1
-
-        datarows = []
-        chapters = [s for s in structure.values() if s['block_type'] == 'chapter']
-        module_order = 0
-        for chapter in chapters:
-            for sequential in chapter['children']:
-                for block in structure[sequential]['children']:
-                    for item in structure[block]['children']:
-                        if structure[item]['block_type'] == 'video':  # !!! only video blocks !!!
-                            row = [
-                                structure[item]['usage_key'].split("@")[-1],
-                                structure[item]['block_type'],
-                                structure[item]['display_name'],
-                                chapter['usage_key'].split("@")[-1],
-                                module_order,
-                                chapter['display_name']
-                            ]
-                            datarows.append(row)
-            module_order += 1
-
-        datarows.insert(0, headers)
-        file = write_to_csv_by_semicolon(datarows)
-        return file
+        yield headers
+
+        for chapter, _, _, item in context.iter_items():
+            if item['block_type'] == 'video':  # !!! only video blocks !!!
+                row = [
+                    item['usage_key'].split("@")[-1],
+                    item['block_type'],
+                    item['display_name'],
+                    chapter['usage_key'].split("@")[-1],
+                    context.module_order[chapter['usage_key']],
+                    chapter['display_name']
+                ]
+                yield row
 
     @classmethod
-    def _get_csv5_data(cls, course_id):
+    def _get_csv5_data(cls, context, keyed_rows=None):
+        header = [
+            'user_id',
+            'item_id',
+            'reviewer_id',
+            'score',
+            'max_score',
+            # 'score_type'
+        ]
+        if keyed_rows is None:
+            keyed_rows = cls._get_csv5_keyed_rows(context)
+        yield header
+
+        key_size = len(cls.INCREMENTAL_KEYS['csv5'])
+        for keyed_row in keyed_rows:
+            yield keyed_row[key_size:]
+
+    @classmethod
+    def _iter_openassessment_submissions(cls, context):
+        """
+        Yield `(usage key, {submission uuid: (submission id, anonymous student id)})` chunks of the submissions
+        to the course open assessments, the blocks ordered by usage key.
+        """
+        usage_keys = sorted(
+            block['usage_key'] for block in context.blocks.values() if block['block_type'] == 'openassessment'
+        )
+        for usage_key in usage_keys:
+            for submissions in get_course_item_submission_chunks(context.course_id, usage_key, 'openassessment'):
+                yield usage_key, submissions
+
+    @classmethod
+    def _get_csv5_keyed_rows(cls, context, watermarks=None, totals=None):
+        """
+        Yield `(usage key, submission id, assessment id, user_id, item_id, reviewer_id, score, max_score)`
+        ordered by the key.
+        """
+        last_assessment_id = (watermarks or {}).get('assessment', 0)
+        anonymous_ids = get_anonymous_ids_map(context.course_id)
+
+        def _get_user_id(anonymous_id):
+            if anonymous_id not in anonymous_ids:
+                user = user_by_anonymous_id(anonymous_id)
+                anonymous_ids[anonymous_id] = user.id if user else None
+            user_id = anonymous_ids[anonymous_id]
+            return None if user_id is None else str(user_id)
 
-        openassessment_blocks = modulestore().get_items(CourseKey.from_string(str(course_id)),
-                                                        qualifiers={'category': 'openassessment'})
-        rows = []
-        for openassessment_block in openassessment_blocks:
+        for x_block_id, submissions in cls._iter_openassessment_submissions(context):
 
             # max_score = 0
             # for criterion in openassessment_block.rubric_criteria:
@@ -414,48 +655,43 @@ class PsychometricsReport(object):
             #         criterion_points.append(option['points'])write_to_csv_by_semicolon
             #     max_score += max(criterion_points)
 
-            x_block_id = openassessment_block.get_xblock_id()
-            all_submission_information = get_course_item_submissions(course_id, x_block_id, 'openassessment')
-            for student_item, submission, score in all_submission_information:
-                # max_score = score.get('points_possible')
-                assessments = _use_read_replica(
-                    Assessment.objects.prefetch_related('parts').prefetch_related('rubric').filter(
-                        submission_uuid=submission['uuid'],
+            rows = []
+            for assessment in get_submissions_assessments(list(submissions), last_assessment_id):
+                if totals is not None:
+                    add_to_totals(totals, 'assessment', assessment.id)
+                submission_id, student_id = submissions[assessment.submission_uuid]
+                user_id = _get_user_id(student_id)
+                reviewer_id = _get_user_id(assessment.scorer_id)
+                if user_id is None or reviewer_id is None:
+                    log.warning(
+                        u"Psychometrics csv5 of %s: skip assessment %s, the anonymous id %s has no user",
+                        context.course_id, assessment.id, student_id if user_id is None else assessment.scorer_id
                     )
-                )
-                for assessment in assessments:
-                    scorer_points = 0
-                    max_score = int(assessment.points_possible)
-                    for part in assessment.parts.order_by('criterion__order_num'):
-                        if part.option is not None:
-                            scorer_points += part.option.points
-                    row = [
-                        str(user_by_anonymous_id(str(student_item['student_id'])).id),
-                        x_block_id.split("@")[-1],
-                        str(user_by_anonymous_id(str(assessment.scorer_id)).id),
-                        scorer_points,
-                        max_score,
-                        # assessment.score_type
-                    ]
-                    rows.append(row)
-        header = [
-            'user_id',
-            'item_id',
-            'reviewer_id',
-            'score',
-            'max_score',
-            # 'score_type'
-        ]
-        datarows = [header] + [row for row in rows]
+                    continue
+                scorer_points = sum(part.option.points for part in assessment.parts.all() if part.option is not None)
+                row = [
+                    x_block_id,
+                    submission_id,
+                    assessment.id,
+                    user_id,
+                    x_block_id.split("@")[-1],
+                    reviewer_id,
+                    scorer_points,
+                    int(assessment.points_possible),
+                    # assessment.score_type
+                ]
+                rows.append(row)
 
-        file = write_to_csv_by_semicolon(datarows)
-        return file
+            # only the assessments of one chunk of submissions are held at a time
+            rows.sort(key=lambda row: row[:3])
+            for row in rows:
+                yield row
 
     @classmethod
-    def _get_course_json_data(cls, course_id):
-        course = CourseKey.from_string(str(course_id))
+    def _get_course_json_data(cls, context):
+        course = context.course_id
         course_data = {
             "short_name": "+".join([course.org, course.course, course.run]),
-            "long_name": get_course_by_id(CourseKey.from_string(str(course_id))).display_name
+            "long_name": context.display_name
         }
         return course_data
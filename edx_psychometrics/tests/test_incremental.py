@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the incremental psychometrics stages, run in the edxapp test environment.
+"""
+import json
+import tempfile
+import unittest
+from datetime import datetime
+
+import mock
+from pytz import UTC
+
+from edx_psychometrics.tasks_helper import PsychometricsReport
+from edx_psychometrics.utils import add_to_totals, merge_keyed_rows, read_keyed_csv, write_to_csv_by_semicolon
+
+COURSE_ID = 'course-v1:org+course+run'
+TABLE = 'courseware_studentmodulehistory'
+
+
+class KeyedRowsTest(unittest.TestCase):
+    def test_read_keyed_csv(self):
+        csv_file = write_to_csv_by_semicolon([
+            [10, TABLE, 2, 1, u'задача', 1, 1514885400],
+            [9, TABLE, 3, 2, u'item', 0, 1514887200],
+        ])
+        self.assertEqual(list(read_keyed_csv(csv_file, (int, unicode, int))), [
+            [10, TABLE, 2, u'1', u'задача', u'1', u'1514885400'],
+            [9, TABLE, 3, u'2', u'item', u'0', u'1514887200'],
+        ])
+        csv_file.close()
+
+    def test_merge_keyed_rows(self):
+        previous = [[2, u'a', 1, 'x'], [9, u'a', 5, 'y']]
+        added = [[2, u'a', 7, 'z'], [10, u'a', 6, 'w']]
+        self.assertEqual(list(merge_keyed_rows(3, previous, added)), [
+            [2, u'a', 1, 'x'], [2, u'a', 7, 'z'], [9, u'a', 5, 'y'], [10, u'a', 6, 'w'],
+        ])
+        self.assertEqual(list(merge_keyed_rows(3, previous, [])), previous)
+
+    def test_add_to_totals(self):
+        totals = {}
+        add_to_totals(totals, TABLE, 5)
+        add_to_totals(totals, TABLE, 3)
+        add_to_totals(totals, 'other', 4)
+        self.assertEqual(totals, {TABLE: [2, 8, 5], 'other': [1, 4, 4]})
+
+
+class FakePartsStore(object):
+    """
+    Parts store keeping the files in memory.
+    """
+    files = {}
+
+    def save(self, course_id, filename, part_file):
+        part_file.seek(0)
+        self.files[filename] = part_file.read()
+
+    def exists(self, course_id, filename):
+        return filename in self.files
+
+    def fetch(self, course_id, filename):
+        local_file = tempfile.TemporaryFile()
+        local_file.write(self.files[filename])
+        local_file.seek(0)
+        return local_file
+
+    def load_json(self, course_id, filename):
+        if filename not in self.files:
+            return None
+        return json.loads(self.files[filename])
+
+    def save_json(self, course_id, filename, data):
+        self.files[filename] = json.dumps(data)
+
+    def delete(self, course_id, filename):
+        self.files.pop(filename, None)
+
+
+class IncrementalPartTest(unittest.TestCase):
+    def setUp(self):
+        FakePartsStore.files = {}
+        # (student module id, history table, history id, user_id, item_id, correct, time)
+        self.history = [
+            (1, TABLE, 1, 1, u'item1', 0, 1514885400),
+            (1, TABLE, 3, 1, u'item1', 1, 1514887200),
+            (2, TABLE, 2, 2, u'item1', 1, 1514889000),
+            (3, TABLE, 4, 3, u'item2', 1, 1514890800),
+        ]
+        self.context = mock.Mock(course_id=COURSE_ID)
+        self.enrolled_students = mock.Mock(**{'values_list.return_value': [1, 2]})
+        self.keyed_rows_calls = []
+
+        for patcher in (
+            mock.patch('edx_psychometrics.tasks_helper.PsychometricsPartsStore', FakePartsStore),
+            mock.patch('edx_psychometrics.tasks_helper.get_history_tables', return_value=[TABLE]),
+            mock.patch.object(PsychometricsReport, '_get_csv1_keyed_rows', side_effect=self._get_keyed_rows),
+            mock.patch.object(PsychometricsReport, '_get_incremental_totals', side_effect=self._get_totals),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get_keyed_rows(self, course_id, watermarks=None, totals=None):
+        self.keyed_rows_calls.append(dict(watermarks or {}))
+        for row in sorted(self.history):
+            if row[2] > (watermarks or {}).get(row[1], 0):
+                if totals is not None:
+                    add_to_totals(totals, row[1], row[2])
+                yield list(row)
+
+    def _get_totals(self, context, stage, watermarks):
+        totals = {}
+        for _, table, history_id in (row[:3] for row in self.history):
+            if history_id <= watermarks.get(table, 0):
+                total = totals.setdefault(table, [0, 0])
+                total[0] += 1
+                total[1] += history_id
+        return totals
+
+    def _get_part(self, entry_id):
+        return PsychometricsReport._get_incremental_part(
+            entry_id, self.context, 'csv1', self.enrolled_students, write_rows=list
+        )
+
+    def _get_expected_part(self):
+        return [('user_id', 'item_id', 'correct', 'time')] + [
+            [unicode(user_id), item_id, unicode(correct), datetime.fromtimestamp(updated, UTC)]
+            for _, _, _, user_id, item_id, correct, updated in sorted(self.history) if user_id in (1, 2)
+        ]
+
+    def test_first_run(self):
+        self.assertEqual(self._get_part(1), self._get_expected_part())
+        self.assertEqual(self.keyed_rows_calls, [{}])
+        self.assertEqual(sorted(FakePartsStore.files), ['state_1_csv1.csv', 'state_csv1.json'])
+        state = json.loads(FakePartsStore.files['state_csv1.json'])
+        self.assertEqual(state['totals'], {TABLE: [4, 10, 4]})
+        self.assertEqual(state['partial'], 'state_1_csv1.csv')
+
+    def test_appended_rows(self):
+        self._get_part(1)
+        self.history += [
+            (1, TABLE, 6, 1, u'item2', 1, 1514892600),
+            (2, TABLE, 5, 2, u'item1', 0, 1514894400),
+        ]
+        self.assertEqual(self._get_part(2), self._get_expected_part())
+        self.assertEqual(self.keyed_rows_calls, [{}, {TABLE: 4}])
+        self.assertNotIn('state_1_csv1.csv', FakePartsStore.files)
+        state = json.loads(FakePartsStore.files['state_csv1.json'])
+        self.assertEqual(state['totals'], {TABLE: [6, 21, 6]})
+
+    def test_changed_rows(self):
+        self._get_part(1)
+        # a row before the watermark stopped qualifying and a late commit took its place
+        self.history = [row for row in self.history if row[2] != 2] + [(2, TABLE, 5, 2, u'item1', 0, 1514894400)]
+        self.assertEqual(self._get_part(2), self._get_expected_part())
+        self.assertEqual(self.keyed_rows_calls, [{}, {}])
+
+    def test_corrupt_state(self):
+        self._get_part(1)
+        FakePartsStore.files['state_csv1.json'] = '{"version": '
+        self.assertEqual(self._get_part(2), self._get_expected_part())
+        self.assertEqual(self.keyed_rows_calls, [{}, {}])
+        self.assertEqual(json.loads(FakePartsStore.files['state_csv1.json'])['partial'], 'state_2_csv1.csv')
+
+    def test_missing_partial(self):
+        self._get_part(1)
+        del FakePartsStore.files['state_1_csv1.csv']
+        self.assertEqual(self._get_part(2), self._get_expected_part())
+        self.assertEqual(self.keyed_rows_calls, [{}, {}])
+
+    def test_old_state_version(self):
+        self._get_part(1)
+        state = json.loads(FakePartsStore.files['state_csv1.json'])
+        state['version'] = PsychometricsReport.INCREMENTAL_STATE_VERSION - 1
+        FakePartsStore.files['state_csv1.json'] = json.dumps(state)
+        self.assertEqual(self._get_part(2), self._get_expected_part())
+        self.assertEqual(self.keyed_rows_calls, [{}, {}])
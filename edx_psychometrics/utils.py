@@ -1,11 +1,25 @@
+import calendar
+import hashlib
+import heapq
+import itertools
 import json
+import logging
+import os
+import resource
+import shutil
 import StringIO
 import codecs
 import csv
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
 
-from io import BytesIO
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_DEFLATED
 
+from courseware.models import StudentModule, StudentModuleHistory
+from openassessment.assessment.models import Assessment
+from student.models import AnonymousUserId, CourseEnrollment
 from submissions.models import Submission
 from submissions.serializers import (
     SubmissionSerializer, StudentItemSerializer, ScoreSerializer
@@ -16,21 +30,60 @@ from lms.djangoapps.instructor_task.tasks_helper.utils import tracker_emit
 
 from django.conf import settings
 from django.core.files.storage import get_valid_filename
-from django.core.files.base import ContentFile
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.models import Count, Sum
+from xmodule.modulestore.django import modulestore
+
+import pytz
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+log = logging.getLogger(__name__)
+
+QUERY_CHUNK_SIZE = 5000
+HISTORY_MODULES_CHUNK_SIZE = 1000
+ARCHIVE_SPOOL_SIZE = 10 * 1024 * 1024
+ASSESSMENTS_BATCH_SIZE = 500
+PARQUET_ROW_GROUP_SIZE = 128 * 1024
+
+# Modulestore methods counted in the report stage metrics
+MODULESTORE_METHODS = ('get_item', 'get_items', 'get_course', 'get_parent_location', 'has_item')
+
+# Typed columns of the psychometrics tables in the parquet output, the rest are strings
+PARQUET_COLUMN_KINDS = {
+    'user_id': 'int',
+    'reviewer_id': 'int',
+    'correct': 'flag',
+    'viewed': 'flag',
+    'module_order': 'int',
+    'score': 'int',
+    'max_score': 'int',
+    'time': 'time',
+}
 
 
 class PsychometricsZipFile(object):
+    """
+    Zip archive kept open for the whole report and backed by a spooled temporary file.
+    """
     def __init__(self):
-        self.inMemoryOutputFile = BytesIO()
+        self.outputFile = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE)
+        self.zip = ZipFile(self.outputFile, 'w', ZIP_DEFLATED, allowZip64=True)
 
     def write(self, inzipfilename, data):
-        zip = ZipFile(self.inMemoryOutputFile, 'a')
-        zip.writestr(inzipfilename, data)
-        zip.close()
+        self.zip.writestr(inzipfilename, data)
+
+    def write_file(self, inzipfilename, filename):
+        self.zip.write(filename, inzipfilename)
 
     def read(self):
-        self.inMemoryOutputFile.seek(0)
-        return self.inMemoryOutputFile
+        self.zip.close()
+        self.outputFile.seek(0)
+        return self.outputFile
 
 
 class PsychometricsReportStore(object):
@@ -39,7 +92,11 @@ class PsychometricsReportStore(object):
 
     def append_csv(self, filename, output_buffer):
         csv_filename = u"{filename}.csv".format(filename=filename)
-        self.archive.write(csv_filename, output_buffer.read())
+        self.append_file(csv_filename, output_buffer)
+
+    def append_file(self, filename, output_buffer):
+        self.archive.write_file(filename, output_buffer.name)
+        output_buffer.close()
 
     def append_json(self, filename, data):
         json_filename = u"{filename}.json".format(filename=filename)
@@ -52,7 +109,66 @@ class PsychometricsReportStore(object):
             course=get_valid_filename(unicode("_").join([course_id.org, course_id.course, course_id.run])),
             timestamp_str=timestamp.strftime("%Y-%m-%d-%H%M")
         )
-        report_store.store(course_id, zip_file_name, self.archive.read())
+        archive_file = self.archive.read()
+        report_store.store(course_id, zip_file_name, archive_file)
+        archive_file.close()
+
+
+class PsychometricsPartsStore(object):
+    """
+    Intermediate report files shared between the report subtasks.
+
+    Files are kept in a subdirectory of the course reports directory,
+    so they are not listed among the reports on the instructor dashboard.
+    """
+    directory = 'psychometrics'
+
+    def __init__(self, config_name='GRADES_DOWNLOAD'):
+        self.report_store = ReportStore.from_config(config_name)
+
+    def _get_path(self, course_id, filename):
+        return self.report_store.path_to(course_id, os.path.join(self.directory, filename))
+
+    def save(self, course_id, filename, part_file):
+        part_file.seek(0)
+        self.delete(course_id, filename)
+        self.report_store.store(course_id, os.path.join(self.directory, filename), part_file)
+
+    def exists(self, course_id, filename):
+        return self.report_store.storage.exists(self._get_path(course_id, filename))
+
+    def fetch(self, course_id, filename):
+        """
+        Copy the stored file into a local named temporary file.
+        """
+        local_file = tempfile.NamedTemporaryFile()
+        stored_file = self.report_store.storage.open(self._get_path(course_id, filename))
+        try:
+            shutil.copyfileobj(stored_file, local_file)
+        finally:
+            stored_file.close()
+        local_file.flush()
+        local_file.seek(0)
+        return local_file
+
+    def load_json(self, course_id, filename):
+        if not self.exists(course_id, filename):
+            return None
+        stored_file = self.report_store.storage.open(self._get_path(course_id, filename))
+        try:
+            return json.load(stored_file)
+        finally:
+            stored_file.close()
+
+    def save_json(self, course_id, filename, data):
+        json_file = write_to_json(data)
+        self.save(course_id, filename, json_file)
+        json_file.close()
+
+    def delete(self, course_id, filename):
+        path = self._get_path(course_id, filename)
+        if self.report_store.storage.exists(path):
+            self.report_store.storage.delete(path)
 
 
 class ViewsReportStore(object):
@@ -79,12 +195,226 @@ class EnrollmentsReportStore(object):
         report_store.store(course_id, csv_filename, cvs_file)
 
 
+class _CountingCursor(object):
+    """
+    Cursor counting the queries it executes, for Django versions without `execute_wrapper`.
+    """
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+    def execute(self, *args, **kwargs):
+        self._metrics.queries += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._metrics.queries += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+
+class StageMetrics(object):
+    """
+    Wall time, SQL queries, modulestore calls, rows and peak RSS of a report stage, measured while entered.
+
+    Queries are counted on every database connection and modulestore calls
+    on the MODULESTORE_METHODS of the modulestore. The peak RSS is the peak
+    of the worker process so far, `max_rss_growth_mb` is how much the stage raised it.
+    Rows are counted by `count_rows` and stay 0 for stages without a table.
+    """
+    FIELDS = ('seconds', 'queries', 'modulestore_calls', 'rows', 'max_rss_mb', 'max_rss_growth_mb')
+
+    def __init__(self):
+        self.seconds = 0
+        self.queries = 0
+        self.modulestore_calls = 0
+        self.rows = 0
+        self.max_rss_mb = 0
+        self.max_rss_growth_mb = 0
+        self._restore = []
+
+    def __enter__(self):
+        self._start_time = time.time()
+        self._start_rss = _get_max_rss_mb()
+        for connection in connections.all():
+            if hasattr(connection, 'execute_wrapper'):
+                self._wrap_execute(connection)
+            else:
+                self._wrap_cursors(connection)
+
+        store = modulestore()
+        for name in MODULESTORE_METHODS:
+            if hasattr(store, name):
+                self._patch(store, name, self._count_calls(getattr(store, name)))
+        return self
+
+    def __exit__(self, *exc_info):
+        for restore in reversed(self._restore):
+            restore()
+        self._restore = []
+        self.seconds = time.time() - self._start_time
+        self.max_rss_mb = _get_max_rss_mb()
+        self.max_rss_growth_mb = self.max_rss_mb - self._start_rss
+
+    def _patch(self, obj, name, value):
+        # methods are replaced on the instance only, restoring drops the replacement
+        previous = obj.__dict__.get(name)
+        setattr(obj, name, value)
+        if previous is None:
+            self._restore.append(lambda: delattr(obj, name))
+        else:
+            self._restore.append(lambda: setattr(obj, name, previous))
+
+    def _wrap_execute(self, connection):
+        def execute(execute, sql, params, many, context):
+            self.queries += 1
+            return execute(sql, params, many, context)
+
+        wrapper = connection.execute_wrapper(execute)
+        wrapper.__enter__()
+        self._restore.append(lambda: wrapper.__exit__(None, None, None))
+
+    def _wrap_cursors(self, connection):
+        for name in ('make_cursor', 'make_debug_cursor'):
+            make_cursor = getattr(connection, name)
+            self._patch(connection, name, lambda cursor, make_cursor=make_cursor: _CountingCursor(
+                make_cursor(cursor), self
+            ))
+
+    def _count_calls(self, method):
+        def counted(*args, **kwargs):
+            self.modulestore_calls += 1
+            return method(*args, **kwargs)
+        return counted
+
+    def count_rows(self, rows):
+        """
+        Pass the table rows through, counting the rows after the header.
+        """
+        self.rows = 0
+        rows = iter(rows)
+        for header in rows:
+            yield header
+            break
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def to_dict(self):
+        return {
+            'seconds': round(self.seconds, 1),
+            'queries': self.queries,
+            'modulestore_calls': self.modulestore_calls,
+            'rows': self.rows,
+            'max_rss_mb': round(self.max_rss_mb, 1),
+            'max_rss_growth_mb': round(self.max_rss_growth_mb, 1),
+        }
+
+
+def format_stage_metrics(metrics):
+    return (
+        u"{seconds} s, {queries} queries, {modulestore_calls} modulestore calls, {rows} rows, "
+        u"peak RSS {max_rss_mb} MB (+{max_rss_growth_mb} MB)"
+    ).format(**metrics)
+
+
+def _get_max_rss_mb():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
 def write_to_csv_by_semicolon(rows):
+    """
+    Encode rows one by one into a named temporary file, so `rows` may be a generator of any size.
+
+    Datetime cells are written in the LMS time zone.
+    """
     # tracker_emit(filename)
-    output_buffer = ContentFile('')
+    output_buffer = tempfile.NamedTemporaryFile(suffix='.csv')
     # output_buffer.write(codecs.BOM_UTF8)
     csvwriter = csv.writer(output_buffer, delimiter=';')
-    csvwriter.writerows(_get_utf8_encoded_rows(rows))
+    csvwriter.writerows(_get_utf8_encoded_rows(rows, pytz.timezone(settings.TIME_ZONE)))
+    output_buffer.flush()
+    output_buffer.seek(0)
+
+    return output_buffer
+
+
+def write_to_parquet(rows):
+    """
+    Write rows, headers first, into a named temporary Parquet file with typed, compressed columns.
+
+    Flags are stored as uint8, numbers as int64 and datetimes as int64 epoch seconds (UTC);
+    strings are dictionary encoded, so the repeated ids are stored once.
+    """
+    if pyarrow is None:
+        raise ImportError('The parquet output format requires pyarrow')
+
+    rows = iter(rows)
+    headers = list(next(rows))
+    kinds = [PARQUET_COLUMN_KINDS.get(header, 'string') for header in headers]
+    schema = pyarrow.schema([
+        pyarrow.field(header, _get_parquet_type(kind)) for header, kind in zip(headers, kinds)
+    ])
+    convert = _get_parquet_converters()
+
+    output_buffer = tempfile.NamedTemporaryFile(suffix='.parquet')
+    writer = pyarrow.parquet.ParquetWriter(output_buffer.name, schema, compression='snappy')
+    while True:
+        batch = list(itertools.islice(rows, PARQUET_ROW_GROUP_SIZE))
+        if not batch:
+            break
+        arrays = [convert[kind](values) for kind, values in zip(kinds, zip(*batch))]
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+    writer.close()
+    output_buffer.seek(0)
+
+    return output_buffer
+
+
+def _get_parquet_type(kind):
+    return {
+        'flag': pyarrow.uint8(),
+        'int': pyarrow.int64(),
+        'time': pyarrow.int64(),
+    }.get(kind, pyarrow.string())
+
+
+def _get_parquet_converters():
+    def _get_epoch(value):
+        # report times are aware datetimes
+        return calendar.timegm(value.utctimetuple())
+
+    return {
+        'flag': lambda values: pyarrow.array([int(value) for value in values], pyarrow.uint8()),
+        'int': lambda values: pyarrow.array([int(value) for value in values], pyarrow.int64()),
+        'time': lambda values: pyarrow.array([_get_epoch(value) for value in values], pyarrow.int64()),
+        'string': lambda values: pyarrow.array([unicode(value) for value in values], pyarrow.string()),
+    }
+
+
+def get_problem_metadata_cache_key(usage_key, course_version, lightweight=False):
+    return u"edx_psychometrics.problem_metadata.{source}.{digest}".format(
+        source='olx' if lightweight else 'module',
+        digest=hashlib.md5(u"{}:{}".format(course_version, usage_key).encode('utf-8')).hexdigest(),
+    )
+
+
+def write_to_json(data):
+    output_buffer = tempfile.NamedTemporaryFile(suffix='.json')
+    json.dump(data, output_buffer)
+    output_buffer.flush()
     output_buffer.seek(0)
 
     return output_buffer
@@ -115,9 +445,303 @@ def get_course_item_submissions(course_id, item_id, item_type, read_replica=True
         )
 
 
-def _get_utf8_encoded_rows(rows):
+def iterate_in_chunks(queryset, fields, chunk_size=QUERY_CHUNK_SIZE):
+    """
+    Stream `fields` of the queryset rows using keyset pagination on the primary key.
+
+    Every chunk is a separate bounded query, so neither the database driver
+    nor the worker ever holds the whole result set.
+    """
+    queryset = queryset.order_by('pk').values_list('pk', *fields)
+    last_pk = None
+    while True:
+        chunk_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_qs[:chunk_size])
+        if not chunk:
+            return
+        for row in chunk:
+            yield row[1:]
+        last_pk = chunk[-1][0]
+
+
+def get_course_enrollments(course_id, read_replica=True):
+    """
+    Stream `(username, email, created, mode)` of every enrollment in the course, active or not.
+    """
+    enrollments = CourseEnrollment.default_objects.filter(course_id=course_id)
+    if read_replica:
+        enrollments = _use_read_replica(enrollments)
+
+    fields = ('user__username', 'user__email', 'created', 'mode')
+    return iterate_in_chunks(enrollments, fields)
+
+
+def get_visited_sequentials_index(course_id, read_replica=True):
+    """
+    Build a `student_id -> set of visited subsection keys` index for the course.
+
+    All sequential StudentModule rows of the course are read in one chunked pass.
+    """
+    student_modules = StudentModule.objects.filter(course_id=course_id, module_type='sequential')
+    if read_replica:
+        student_modules = _use_read_replica(student_modules)
+
+    index = defaultdict(set)
+    for student_id, module_state_key in iterate_in_chunks(student_modules, ('student_id', 'module_state_key')):
+        index[student_id].add(str(module_state_key))
+    return index
+
+
+def get_sequential_positions_index(course_id, read_replica=True):
+    """
+    Build a `student_id -> {subsection key: position}` index for the course.
+
+    The `state` of every sequential StudentModule row is decoded exactly once.
+    Rows without a stored position are left out of the index.
+    """
+    student_modules = StudentModule.objects.filter(course_id=course_id, module_type='sequential')
+    if read_replica:
+        student_modules = _use_read_replica(student_modules)
+
+    index = defaultdict(dict)
+    fields = ('student_id', 'module_state_key', 'state')
+    for student_id, module_state_key, state in iterate_in_chunks(student_modules, fields):
+        try:
+            position = json.loads(state)['position']
+        except (TypeError, ValueError, KeyError):
+            continue
+        index[student_id][str(module_state_key)] = position
+    return index
+
+
+def get_history_tables():
+    return [history_model._meta.db_table for history_model in _get_history_models()]
+
+
+def _get_history_models():
+    """
+    Return the StudentModule history tables to read, the same way `BaseStudentModuleHistory.get_history` does.
+    """
+    history_models = []
+    if settings.FEATURES.get('ENABLE_CSMH_EXTENDED'):
+        from coursewarehistoryextended.models import StudentModuleHistoryExtended
+        history_models.append(StudentModuleHistoryExtended)
+    if (not settings.FEATURES.get('ENABLE_CSMH_EXTENDED') or
+            settings.FEATURES.get('ENABLE_READING_FROM_MULTIPLE_HISTORY_TABLES')):
+        history_models.append(StudentModuleHistory)
+    return history_models
+
+
+def get_course_problem_modules(course_id, chunk_size=HISTORY_MODULES_CHUNK_SIZE, read_replica=True):
+    """
+    Yield chunks of `{student module id: student id}` for the course problems whose current state has a `correct_map`.
+    """
+    student_modules = StudentModule.objects.filter(
+        course_id=course_id,
+        module_type='problem',
+        state__contains='correct_map',
+    )
+    if read_replica:
+        student_modules = _use_read_replica(student_modules)
+
+    chunk = {}
+    for module_id, student_id in iterate_in_chunks(student_modules, ('pk', 'student_id')):
+        chunk[module_id] = student_id
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = {}
+    if chunk:
+        yield chunk
+
+
+def get_course_problems_history(course_id, watermarks=None, totals=None, read_replica=True):
+    """
+    Stream `(student module id, table, history id, student id, state, created)` for every graded history entry
+    of the course problems, ordered by student module id, table and history id.
+
+    The history tables may live in their own database (the extended history is routed
+    to `student_module_history` without constraints), so they are not joined to
+    StudentModule: the module ids are read in chunks from the courseware database and
+    every history table is queried by these ids through its own database.
+    When `watermarks` maps a history table to a row id, only newer rows of the table are read.
+    Every row read is counted in `totals` if it is given, see `add_to_totals`.
+    """
+    watermarks = watermarks or {}
+    fields = ('pk', 'student_module_id', 'state', 'created')
+    history_models = _get_history_models()
+    for modules in get_course_problem_modules(course_id, read_replica=read_replica):
+        rows = []
+        for history_model in history_models:
+            table = history_model._meta.db_table
+            history = _get_graded_history(history_model, modules, read_replica)
+            if table in watermarks:
+                history = history.filter(pk__gt=watermarks[table])
+            for history_id, module_id, state, created in history.values_list(*fields):
+                rows.append((module_id, table, history_id, state, created))
+        rows.sort(key=lambda row: row[:3])
+
+        for module_id, table, history_id, state, created in rows:
+            if totals is not None:
+                add_to_totals(totals, table, history_id)
+            student_id = modules[module_id]
+            try:
+                state = json.loads(state)
+            except ValueError:
+                log.info("Get history: invalid state of student %s", student_id)
+                continue
+            yield module_id, table, history_id, student_id, state, created
+
+
+def get_course_problems_history_totals(course_id, watermarks, read_replica=True):
+    """
+    Return `{table: [row count, id sum]}` of the graded history rows up to the `watermarks` of the tables.
+
+    The rows are counted by the database, without reading them.
+    """
+    totals = dict((table, [0, 0]) for table in watermarks)
+    history_models = [model for model in _get_history_models() if model._meta.db_table in watermarks]
+    for modules in get_course_problem_modules(course_id, read_replica=read_replica):
+        for history_model in history_models:
+            table = history_model._meta.db_table
+            history = _get_graded_history(history_model, modules, read_replica)
+            aggregate = history.filter(pk__lte=watermarks[table]).aggregate(count=Count('pk'), id_sum=Sum('pk'))
+            totals[table][0] += aggregate['count']
+            totals[table][1] += aggregate['id_sum'] or 0
+    return totals
+
+
+def _get_graded_history(history_model, module_ids, read_replica=True):
+    history = history_model.objects.filter(
+        student_module_id__in=list(module_ids),
+        state__contains='correct_map',
+    )
+    if read_replica:
+        history = _use_history_read_replica(history)
+    return history
+
+
+def add_to_totals(totals, table, row_id):
+    """
+    Count a row of `table` in `totals`, a `{table: [row count, id sum, largest id]}` dict.
+    """
+    total = totals.setdefault(table, [0, 0, 0])
+    total[0] += 1
+    total[1] += row_id
+    total[2] = max(total[2], row_id)
+
+
+def read_keyed_csv(csv_file, key_types):
+    """
+    Read back rows written by `write_to_csv_by_semicolon` whose first columns are a key of `key_types`.
+    """
+    for row in csv.reader(csv_file, delimiter=';'):
+        row = [value.decode('utf-8') for value in row]
+        row[:len(key_types)] = [key_type(value) for key_type, value in zip(key_types, row)]
+        yield row
+
+
+def merge_keyed_rows(key_size, *keyed_rows):
+    """
+    Merge streams of rows sorted by their first `key_size` columns.
+    """
+    def _decorate(rows):
+        for row in rows:
+            yield row[:key_size], row
+
+    for _, row in heapq.merge(*[_decorate(rows) for rows in keyed_rows]):
+        yield row
+
+
+def get_course_item_submission_chunks(course_id, item_id, item_type, chunk_size=ASSESSMENTS_BATCH_SIZE,
+                                     read_replica=True):
+    """
+    Yield chunks of `{submission uuid: (submission id, anonymous student id)}` of the submissions to the item.
+    """
+    submission_qs = Submission.objects.filter(
+        student_item__course_id=course_id,
+        student_item__item_type=item_type,
+        student_item__item_id=item_id,
+    )
+    if read_replica:
+        submission_qs = _use_read_replica(submission_qs)
+
+    chunk = {}
+    for submission_id, uuid, student_id in iterate_in_chunks(
+            submission_qs, ('pk', 'uuid', 'student_item__student_id')):
+        chunk[str(uuid)] = (submission_id, student_id)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = {}
+    if chunk:
+        yield chunk
+
+
+def get_submissions_assessments(submission_uuids, last_assessment_id=0, read_replica=True):
+    """
+    Stream assessments of the submissions with their parts, selected options and rubric prefetched.
+
+    Assessments are fetched with batched `IN` queries, so scores and
+    `points_possible` (the rubric criteria options) may be computed without
+    any further queries.
+    """
+    for start in range(0, len(submission_uuids), ASSESSMENTS_BATCH_SIZE):
+        assessments = Assessment.objects.filter(
+            submission_uuid__in=submission_uuids[start:start + ASSESSMENTS_BATCH_SIZE],
+            id__gt=last_assessment_id,
+        ).prefetch_related('parts__option', 'rubric__criteria__options')
+        if read_replica:
+            assessments = _use_read_replica(assessments)
+
+        for assessment in assessments:
+            yield assessment
+
+
+def get_submissions_assessments_totals(submission_uuids, last_assessment_id, read_replica=True):
+    """
+    Return `[row count, id sum]` of the assessments of the submissions up to `last_assessment_id`.
+    """
+    totals = [0, 0]
+    for start in range(0, len(submission_uuids), ASSESSMENTS_BATCH_SIZE):
+        assessments = Assessment.objects.filter(
+            submission_uuid__in=submission_uuids[start:start + ASSESSMENTS_BATCH_SIZE],
+            id__lte=last_assessment_id,
+        )
+        if read_replica:
+            assessments = _use_read_replica(assessments)
+
+        aggregate = assessments.aggregate(count=Count('pk'), id_sum=Sum('pk'))
+        totals[0] += aggregate['count']
+        totals[1] += aggregate['id_sum'] or 0
+    return totals
+
+
+def get_anonymous_ids_map(course_id, read_replica=True):
+    """
+    Return an `anonymous user id -> user id` map of the course anonymous ids.
+    """
+    anonymous_ids = AnonymousUserId.objects.filter(course_id=course_id)
+    if read_replica:
+        anonymous_ids = _use_read_replica(anonymous_ids)
+
+    return dict(iterate_in_chunks(anonymous_ids, ('anonymous_user_id', 'user_id')))
+
+
+def _get_utf8_encoded_rows(rows, time_zone):
     for row in rows:
-        yield [unicode(item).encode('utf-8') for item in row]
+        yield [
+            (item.astimezone(time_zone).strftime("%d.%m.%Y %H:%M:%S") if isinstance(item, datetime) else
+             unicode(item).encode('utf-8'))
+            for item in row
+        ]
+
+
+def _use_history_read_replica(queryset):
+    """
+    Use the read replica only for the history tables routed to the default database.
+    """
+    if router.db_for_read(queryset.model) == DEFAULT_DB_ALIAS:
+        return _use_read_replica(queryset)
+    return queryset
 
 
 def _use_read_replica(queryset):
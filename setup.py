@@ -74,5 +74,8 @@ setup(
         "requests",
         "six",
     ],
+    extras_require={
+        "parquet": ["pyarrow"],
+    },
     dependency_links=[]
 )